@@ -25,6 +25,8 @@ CREATE TABLE IF NOT EXISTS product (
 -- Indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_product_active ON product(active);
 CREATE INDEX IF NOT EXISTS idx_product_name ON product(name);
+-- Normalized-name lookup used by partner ingest matching (not a uniqueness rule)
+CREATE INDEX IF NOT EXISTS idx_product_norm_name ON product(lower(trim(name)));
 
 
 -- =============================
@@ -47,6 +49,9 @@ CREATE TABLE IF NOT EXISTS partner_api_keys (
 	description TEXT,
 	FOREIGN KEY (partner_id) REFERENCES partner(id)
 );
+-- Key lookups filter on a short, non-secret prefix and compare the full key
+-- in constant time (see security.lookup_partner_id)
+CREATE INDEX IF NOT EXISTS ix_api_keys_prefix ON partner_api_keys(substr(api_key, 1, 4));
 
 -- Track processed partner feed checksums to avoid re-processing the same feed
 CREATE TABLE IF NOT EXISTS partner_feed_imports (
@@ -73,6 +78,10 @@ CREATE TABLE IF NOT EXISTS partner_ingest_jobs (
 	processed_at TIMESTAMP,
 	error TEXT
 );
+-- Per-status counts on the admin jobs endpoint
+CREATE INDEX IF NOT EXISTS ix_jobs_status ON partner_ingest_jobs(status);
+-- Requeue-all-failed for one partner (partner_id + status filter)
+CREATE INDEX IF NOT EXISTS ix_jobs_partner_status ON partner_ingest_jobs(partner_id, status);
 
 
 -- Audit trail for partner operations (security / compliance)
@@ -84,6 +93,8 @@ CREATE TABLE IF NOT EXISTS partner_ingest_audit (
 	payload TEXT,
 	created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+-- Admin audit view filters by action / case-insensitive api_key prefix, newest first
+CREATE INDEX IF NOT EXISTS ix_audit_action_apikey_ci_id ON partner_ingest_audit(action, lower(api_key), id DESC);
 
 
 -- Optional: store large diagnostics offloaded from partner_ingest_jobs
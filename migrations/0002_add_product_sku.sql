@@ -0,0 +1,11 @@
+-- Migration: add 'sku' column to product plus the lookup indexes used by
+-- partner ingest matching (SKU first, then case-insensitive name).
+-- SQLite allows multiple NULLs in a UNIQUE index, so products without a SKU
+-- are unaffected. The name index is not unique: names differing only in case
+-- or surrounding whitespace may coexist.
+
+BEGIN TRANSACTION;
+ALTER TABLE product ADD COLUMN sku TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_product_sku ON product(sku);
+CREATE INDEX IF NOT EXISTS idx_product_norm_name ON product(lower(trim(name)));
+COMMIT;
@@ -0,0 +1,6 @@
+-- Migration: index partner_ingest_jobs.status for the admin per-status counts
+-- (databases created from db/init.sql after this change already have it).
+
+BEGIN TRANSACTION;
+CREATE INDEX IF NOT EXISTS ix_jobs_status ON partner_ingest_jobs(status);
+COMMIT;
@@ -0,0 +1,6 @@
+-- Migration: index partner_ingest_audit for the admin audit view filters
+-- (action + case-insensitive api_key prefix, newest first).
+
+BEGIN TRANSACTION;
+CREATE INDEX IF NOT EXISTS ix_audit_action_apikey_ci_id ON partner_ingest_audit(action, lower(api_key), id DESC);
+COMMIT;
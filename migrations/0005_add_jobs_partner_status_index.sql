@@ -0,0 +1,7 @@
+-- Migration: index partner_ingest_jobs by (partner_id, status) for the
+-- requeue-failed endpoint. partner_api_keys.api_key is already UNIQUE, so
+-- key lookups use its automatic index.
+
+BEGIN TRANSACTION;
+CREATE INDEX IF NOT EXISTS ix_jobs_partner_status ON partner_ingest_jobs(partner_id, status);
+COMMIT;
@@ -0,0 +1,7 @@
+-- Migration: index partner_api_keys by the first 4 characters of the stored
+-- key. Lookups select the (few) keys sharing that prefix and compare the full
+-- value with hmac.compare_digest instead of an exact-match WHERE clause.
+
+BEGIN TRANSACTION;
+CREATE INDEX IF NOT EXISTS ix_api_keys_prefix ON partner_api_keys(substr(api_key, 1, 4));
+COMMIT;
@@ -29,6 +29,8 @@ import requests
 
 BASE = "http://127.0.0.1:5000"
 
+# Shared keep-alive session for the partner API calls (one TCP connection
+# reused across the demo steps instead of a new one per request)
 session = requests.Session()
 
 
@@ -43,14 +45,14 @@ def run_seed():
 
 def partner_contract():
     print("GET /partner/contract")
-    r = requests.get(f"{BASE}/partner/contract")
+    r = session.get(f"{BASE}/partner/contract")
     print(r.status_code, r.text)
 
 
 def partner_onboard():
     print("POST /partner/onboard (admin)")
     payload = {"name": "Demo Onboard", "format": "json", "description": "from demo script"}
-    r = requests.post(f"{BASE}/partner/onboard", json=payload, headers={"X-Admin-Key": "admin-demo-key"})
+    r = session.post(f"{BASE}/partner/onboard", json=payload, headers={"X-Admin-Key": "admin-demo-key"})
     print(r.status_code, r.text)
     return r.json() if r.ok else None
 
@@ -58,7 +60,7 @@ def partner_onboard():
 def partner_sync_ingest(api_key="test-key"):
     print("POST /partner/ingest?async=0 (sync)")
     data = [{"sku": "demo-sync-1", "name": "Demo Sync", "price_cents": 1999, "stock": 5}]
-    r = requests.post(f"{BASE}/partner/ingest?async=0", json=data, headers={"X-API-Key": api_key})
+    r = session.post(f"{BASE}/partner/ingest?async=0", json=data, headers={"X-API-Key": api_key})
     print(r.status_code, r.text)
     return r
 
@@ -66,7 +68,7 @@ def partner_sync_ingest(api_key="test-key"):
 def partner_async_ingest(api_key="test-key"):
     print("POST /partner/ingest (async)")
     data = [{"sku": "demo-async-1", "name": "Demo Async", "price_cents": 1299, "stock": 3}]
-    r = requests.post(f"{BASE}/partner/ingest?async=1", json=data, headers={"X-API-Key": api_key})
+    r = session.post(f"{BASE}/partner/ingest?async=1", json=data, headers={"X-API-Key": api_key})
     print(r.status_code, r.text)
     if r.status_code == 202:
         try:
@@ -81,7 +83,7 @@ def poll_job(job_id, api_key="test-key", timeout=30):
     print(f"Polling job {job_id} ...")
     deadline = time.time() + timeout
     while time.time() < deadline:
-        r = requests.get(f"{BASE}/partner/jobs/{job_id}", headers={"X-API-Key": api_key})
+        r = session.get(f"{BASE}/partner/jobs/{job_id}", headers={"X-API-Key": api_key})
         if r.status_code == 200:
             j = r.json()
             print(json.dumps(j, indent=2))
@@ -95,7 +97,7 @@ def poll_job(job_id, api_key="test-key", timeout=30):
 
 def fetch_diagnostics(diag_id, api_key="test-key"):
     print(f"GET /partner/diagnostics/{diag_id}")
-    r = requests.get(f"{BASE}/partner/diagnostics/{diag_id}", headers={"X-API-Key": api_key})
+    r = session.get(f"{BASE}/partner/diagnostics/{diag_id}", headers={"X-API-Key": api_key})
     print(r.status_code, r.text)
     return r
 
@@ -103,7 +105,7 @@ def fetch_diagnostics(diag_id, api_key="test-key"):
 def contract_validate():
     print("POST /partner/contract/validate")
     data = [{"sku": "sample-1", "name": "Sample", "price_cents": 1000, "stock": 1}]
-    r = requests.post(f"{BASE}/partner/contract/validate", json=data)
+    r = session.post(f"{BASE}/partner/contract/validate", json=data)
     print(r.status_code, r.text)
     return r
 
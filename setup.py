@@ -8,5 +8,9 @@ setup(
         "flask",
         "werkzeug",
     ],
+    # orjson is optional: JSON encoding/decoding falls back to the stdlib
+    extras_require={
+        "fast-json": ["orjson>=3.8"],
+    },
     python_requires=">=3.8",
 )
\ No newline at end of file
@@ -19,6 +19,7 @@ from .payment import process as payment_process
 from .main import init_db
 from .adapters.registry import get_adapter
 from .partners.partner_ingest_service import validate_products, upsert_products
+from .partners.security import lookup_partner_id
 
 
 def create_app() -> Flask:
@@ -50,8 +51,6 @@ def create_app() -> Flask:
     # Start background ingest worker if partners blueprint is available
     try:
         from .partners.ingest_queue import start_worker
-        root = Path(__file__).resolve().parents[1]
-        db_path = os.environ.get("APP_DB_PATH", str(root / "app.sqlite"))
         start_worker(db_path)
     except Exception:
         # best-effort: don't fail app startup if worker can't be started
@@ -264,6 +263,14 @@ def create_app() -> Flask:
                 return redirect(url_for("login"))
             return f(*args, **kwargs)
         return decorated_function
+    # Use the resilient payment path (retry + circuit breaker). Imported here,
+    # once per app rather than per checkout, to avoid circular import issues.
+    try:
+        from .flash_sales.payment_resilience import process_payment_resilient as checkout_payment_cb
+    except Exception:
+        # Fallback to the simple payment processor if resilience module unavailable
+        checkout_payment_cb = payment_process
+
     @app.post("/checkout")
     def checkout():
         pay_method = request.form.get("payment_method", "CARD")
@@ -274,20 +281,11 @@ def create_app() -> Flask:
         conn = get_conn()
         repo = get_repo(conn)
         try:
-            # Use the resilient payment path (retry + circuit breaker)
-            # Import lazily to avoid circular import issues
-            try:
-                from .flash_sales.payment_resilience import process_payment_resilient
-                payment_cb = process_payment_resilient
-            except Exception:
-                # Fallback to the simple payment processor if resilience module unavailable
-                payment_cb = payment_process
-
             sale_id = repo.checkout_transaction(
                 user_id=user_id,
                 cart=cart_list,
                 pay_method=pay_method,
-                payment_cb=payment_cb,
+                payment_cb=checkout_payment_cb,
             )
         except Exception as e:
             flash(str(e), "error")
@@ -308,9 +306,7 @@ def create_app() -> Flask:
         # validate key against DB
         conn_check = get_conn()
         try:
-            cur = conn_check.execute('SELECT partner_id FROM partner_api_keys WHERE api_key = ?', (api_key,))
-            row = cur.fetchone()
-            if not row:
+            if lookup_partner_id(conn_check, api_key) is None:
                 return ("Invalid API key", 401)
         finally:
             conn_check.close()
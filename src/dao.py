@@ -8,11 +8,20 @@ from typing import Callable, Iterable, List, Tuple
 CartItem = Tuple[int, int]  # (product_id, qty)
 PaymentCallback = Callable[[str, int], Tuple[str, str | None]]
 
+# Stock check and decrement in one statement (Partner A product table convention)
+_SQL_DECREMENT_STOCK = "UPDATE product SET stock = stock - ? WHERE id = ? AND stock >= ? AND active = 1"
+
 
 def get_connection(db_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, cached_statements=256)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
+    # wait on the write lock instead of failing fast; WAL lets reads run
+    # alongside a checkout holding BEGIN IMMEDIATE
+    conn.execute("PRAGMA busy_timeout = 5000")
+    if db_path != ":memory:":
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
     return conn
 
 
@@ -92,9 +101,11 @@ class SalesRepo:
 
         # Persist sale + items + payment and decrement stock atomically
         with transaction(self.conn):
-            # Double-check stock under transaction
+            # Decrement stock first: the conditional UPDATE is the stock check,
+            # so a short item fails here and rolls back (A5)
             for product_id, qty, _ in line_prices:
-                if not self._check_stock(product_id, qty):
+                cur = self.conn.execute(_SQL_DECREMENT_STOCK, (qty, product_id, qty))
+                if cur.rowcount != 1:
                     raise RuntimeError("Insufficient stock at commit time")  # triggers rollback (A5)
 
             cur = self.conn.execute(
@@ -103,16 +114,10 @@ class SalesRepo:
             )
             sale_id = cur.lastrowid
 
-            for product_id, qty, unit_price in line_prices:
-                self.conn.execute(
-                    "INSERT INTO sale_item(sale_id, product_id, quantity, price_cents) VALUES(?, ?, ?, ?)",
-                    (sale_id, product_id, qty, unit_price),
-                )
-                # Decrement stock using Partner A product table convention
-                self.conn.execute(
-                    "UPDATE product SET stock = stock - ? WHERE id = ?",
-                    (qty, product_id),
-                )
+            self.conn.executemany(
+                "INSERT INTO sale_item(sale_id, product_id, quantity, price_cents) VALUES(?, ?, ?, ?)",
+                [(sale_id, product_id, qty, unit_price) for product_id, qty, unit_price in line_prices],
+            )
 
             self.conn.execute(
                 "INSERT INTO payment(sale_id, method, amount_cents, status, ref) VALUES(?, ?, ?, 'APPROVED', ?)",
@@ -135,15 +140,3 @@ class SalesRepo:
         if row and int(row["active"]) == 1:
             return row
         return None
-
-    def _check_stock(self, product_id: int, qty: int) -> bool:
-        # Prefer Partner A repo if provided
-        try:
-            return self.product_repo.check_stock(product_id, qty)
-        except NotImplementedError:
-            pass
-        row = self.conn.execute(
-            "SELECT stock FROM product WHERE id = ?",
-            (product_id,),
-        ).fetchone()
-        return bool(row and int(row[0]) >= qty)
@@ -0,0 +1,230 @@
+"""SQLite connection pooling for the partner routes and ingest paths.
+
+SQLite allows a single writer at a time, so each database file gets one
+long-lived writer connection guarded by a lock, plus a bounded queue of
+read-only connections (opened with ``mode=ro``) for lookups such as the
+admin views and the feed idempotency check. Funnelling writes through one
+connection avoids repeated SQLITE_BUSY retries while readers proceed in
+parallel, and reusing connections avoids re-opening the database files and
+re-parsing the schema on every request.
+
+Request handlers submit writes with ``execute_write``/``execute_write_fn``;
+a background thread per pool runs them one at a time on the writer
+connection so handlers never contend for the write lock themselves.
+"""
+from __future__ import annotations
+import atexit
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+# Applied once to every pooled connection when it is opened: a larger page
+# cache, memory-mapped reads of hot pages (256 MiB window) and in-memory
+# temp tables for sorts (ORDER BY without a matching index).
+CONNECTION_PRAGMAS = (
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-32000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+)
+# Writer only. WAL lets readers run alongside the writer (the mode is stored
+# in the database file); synchronous=NORMAL is durable enough under WAL.
+WRITER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+) + CONNECTION_PRAGMAS
+# Prepared-statement cache per pooled connection (sqlite3 default is 128)
+CACHED_STATEMENTS = 256
+
+
+def open_connection(db_path: str, timeout: float = 5.0) -> sqlite3.Connection:
+    """Open a standalone read-write connection with the writer pragmas applied.
+
+    For code that keeps its own connection outside the pool (the ingest
+    worker's job claims, which need BEGIN IMMEDIATE on a private handle).
+    """
+    conn = sqlite3.connect(db_path, timeout=timeout, cached_statements=CACHED_STATEMENTS)
+    for pragma in WRITER_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class IngestConnectionPool:
+    """One writer connection plus up to `max_readers` read-only connections for a DB file."""
+
+    def __init__(self, db_path: str, timeout: float = 5.0, max_readers: int = 8, write_timeout: float = 30.0):
+        self.db_path = str(db_path)
+        self.timeout = timeout
+        self.max_readers = max_readers
+        self.write_timeout = write_timeout
+        self._write_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._idle: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=max_readers)
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._write_queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._write_thread: Optional[threading.Thread] = None
+        self._write_thread_lock = threading.Lock()
+
+    def _open_writer(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        for pragma in WRITER_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _open_reader(self) -> sqlite3.Connection:
+        uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=self.timeout, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        # Rows index like tuples and convert with dict(row) for JSON responses
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Yield the singleton write connection while holding the write lock.
+
+        Commits on clean exit and rolls back if the block raises.
+        """
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open_writer()
+            conn = self._writer
+            try:
+                yield conn
+            except Exception:
+                conn.rollback()
+                raise
+            else:
+                conn.commit()
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Check out a read-only connection for the duration of the block.
+
+        Connections are opened lazily up to `max_readers`; beyond that callers
+        wait (up to `timeout`) for one to be returned.
+        """
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._readers_lock:
+            if len(self._readers) < self.max_readers:
+                conn = self._open_reader()
+                self._readers.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("timed out waiting for a read connection") from None
+
+    def submit_write_fn(self, fn: Callable[[sqlite3.Connection], Any]) -> Future:
+        """Queue fn(conn) for the writer thread without waiting for it."""
+        fut: Future = Future()
+        self._ensure_write_thread()
+        self._write_queue.put((fn, fut))
+        return fut
+
+    def execute_write_fn(self, fn: Callable[[sqlite3.Connection], Any], timeout: Optional[float] = None) -> Any:
+        """Run fn(conn) on the writer thread inside one transaction and return its result.
+
+        Exceptions raised by fn are re-raised in the caller after rollback.
+        """
+        fut = self.submit_write_fn(fn)
+        return fut.result(timeout=self.write_timeout if timeout is None else timeout)
+
+    def execute_write(self, sql: str, params: Sequence[Any] = (), timeout: Optional[float] = None) -> sqlite3.Cursor:
+        """Execute a single write statement on the writer thread; returns the cursor."""
+        return self.execute_write_fn(lambda conn: conn.execute(sql, params), timeout=timeout)
+
+    def _ensure_write_thread(self) -> None:
+        with self._write_thread_lock:
+            if self._write_thread is None or not self._write_thread.is_alive():
+                self._write_thread = threading.Thread(target=self._write_loop, name="partner-db-writer", daemon=True)
+                self._write_thread.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            item = self._write_queue.get()
+            if item is None:
+                return
+            self._run_write(*item)
+
+    def _run_write(self, fn: Callable[[sqlite3.Connection], Any], fut: Future) -> None:
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            with self.writer() as conn:
+                result = fn(conn)
+        except BaseException as e:
+            fut.set_exception(e)
+        else:
+            fut.set_result(result)
+
+    def close(self) -> None:
+        with self._write_thread_lock:
+            thread, self._write_thread = self._write_thread, None
+        if thread is not None:
+            self._write_queue.put(None)
+            thread.join(timeout=self.write_timeout)
+        # Jobs queued behind the stop sentinel would never run (a deferred
+        # audit flush left unrun strands its pending rows); finish them here
+        while True:
+            try:
+                item = self._write_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._run_write(*item)
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+            self._idle = queue.Queue(maxsize=self.max_readers)
+        for conn in readers:
+            conn.close()
+        with self._write_lock:
+            if self._writer is not None:
+                try:
+                    # refresh planner statistics (ANALYZE) where SQLite thinks they're stale
+                    self._writer.execute("PRAGMA optimize")
+                except sqlite3.Error:
+                    pass
+                self._writer.close()
+                self._writer = None
+
+
+_pools: Dict[str, IngestConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+@atexit.register
+def _close_pools() -> None:
+    # close() lets the writer thread drain queued writes (e.g. deferred audits)
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+
+def get_pool(db_path: str) -> IngestConnectionPool:
+    """Return the process-wide pool for db_path, creating it on first use."""
+    db_path = str(db_path)
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = IngestConnectionPool(db_path)
+        return pool
@@ -8,18 +8,72 @@ the worker will schedule a retry using exponential backoff up to `max_attempts`.
 """
 from __future__ import annotations
 import json
+import os
 import threading
 import time
 import logging
 import random
 from typing import Any, Dict, Optional, Tuple
 import sqlite3
+from pathlib import Path
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+from .json_provider import loads_json
 from .partner_ingest_service import upsert_products, validate_products
+from .db import get_pool, open_connection
 from .metrics import incr
-from .security import record_audit
+from .security import record_audit_deferred
 
 logger = logging.getLogger(__name__)
 
+_DEFAULT_DB = str(Path(__file__).resolve().parents[2] / "app.sqlite")
+
+
+def _dumps(obj: Any) -> str:
+    """Serialize job payloads, errors and diagnostics, via orjson when available."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            # e.g. integers wider than 64 bits
+            pass
+    return json.dumps(obj)
+
+
+# A feed identical to one still waiting or running would just repeat its work
+SQL_PENDING_JOB = (
+    "SELECT id FROM partner_ingest_jobs WHERE partner_id = ? AND feed_hash = ? "
+    "AND status IN ('pending', 'in_progress') ORDER BY id DESC LIMIT 1"
+)
+
+
+def pending_job_id(conn: sqlite3.Connection, partner_id: int, feed_hash: str | None) -> Optional[int]:
+    """Return the id of an unfinished job for the same partner and feed, if any."""
+    if not feed_hash:
+        return None
+    row = conn.execute(SQL_PENDING_JOB, (partner_id, feed_hash)).fetchone()
+    return row[0] if row else None
+
+
+def insert_job(conn: sqlite3.Connection, partner_id: int, products: list[Dict[str, Any]], feed_hash: str | None = None) -> int:
+    """Insert a pending job on an open connection (caller commits); returns job id.
+
+    If the same feed (by feed_hash) is already pending or in progress for the
+    partner, no row is added and that job's id is returned instead.
+    """
+    existing = pending_job_id(conn, partner_id, feed_hash)
+    if existing is not None:
+        incr("deduplicated")
+        return existing
+    cur = conn.execute(
+        "INSERT INTO partner_ingest_jobs (partner_id, payload, status, feed_hash) VALUES (?, ?, 'pending', ?)",
+        (partner_id, _dumps(products), feed_hash),
+    )
+    incr("enqueued")
+    return cur.lastrowid
+
 
 def enqueue_feed_db(db_path: str, partner_id: int, products: list[Dict[str, Any]], feed_hash: str | None = None) -> int:
     """Persist a job into the partner_ingest_jobs table and return job id.
@@ -36,13 +90,10 @@ def enqueue_feed_db(db_path: str, partner_id: int, products: list[Dict[str, Any]
     last_exc: Exception | None = None
     for attempt in range(1, max_attempts + 1):
         try:
-            conn = sqlite3.connect(db_path, timeout=timeout)
-            cur = conn.cursor()
-            cur.execute("INSERT INTO partner_ingest_jobs (partner_id, payload, status, feed_hash) VALUES (?, ?, 'pending', ?)", (partner_id, json.dumps(products), feed_hash))
-            jid = cur.lastrowid
+            conn = open_connection(db_path, timeout=timeout)
+            jid = insert_job(conn, partner_id, products, feed_hash=feed_hash)
             conn.commit()
             conn.close()
-            incr("enqueued")
             return jid
         except sqlite3.OperationalError as e:
             last_exc = e
@@ -61,16 +112,47 @@ def enqueue_feed_db(db_path: str, partner_id: int, products: list[Dict[str, Any]
     raise RuntimeError("enqueue_feed_db failed for unknown reasons")
 
 
-def enqueue_feed(partner_id: int, products: list[Dict[str, Any]], feed_hash: str | None = None) -> None:
-    """Compatibility wrapper: find APP_DB_PATH from environment and persist job."""
-    import os
-    from pathlib import Path
-    root = Path(__file__).resolve().parents[2]
-    db_path = str(Path(os.environ.get("APP_DB_PATH") or root / "app.sqlite"))
-    enqueue_feed_db(db_path, partner_id, products, feed_hash=feed_hash)
+def enqueue_feed(partner_id: int, products: list[Dict[str, Any]], feed_hash: str | None = None) -> int:
+    """Persist a job for the APP_DB_PATH database and return its id.
+
+    The insert runs on that database's pooled writer thread, so it queues
+    behind other writes instead of retrying on "database is locked".
+    """
+    db_path = os.environ.get("APP_DB_PATH") or _DEFAULT_DB
+    return get_pool(db_path).execute_write_fn(lambda conn: insert_job(conn, partner_id, products, feed_hash=feed_hash))
 
 
 _stop_event: Optional[threading.Event] = None
+# start_worker runs from create_app and from every async ingest request
+_start_lock = threading.Lock()
+# Job attempts the background worker has finished (any outcome), so callers
+# can wait on progress instead of polling the jobs table
+_attempts_done = 0
+_attempts_cond = threading.Condition()
+
+
+def _attempt_finished() -> None:
+    global _attempts_done
+    with _attempts_cond:
+        _attempts_done += 1
+        _attempts_cond.notify_all()
+
+
+def attempts_done() -> int:
+    """Job attempts finished so far; read it as the baseline for wait_for_attempts."""
+    with _attempts_cond:
+        return _attempts_done
+
+
+def wait_for_attempts(count: int, timeout: float) -> bool:
+    """Block until `count` job attempts have finished in total; False on timeout.
+
+    The counter is process-wide and restarts when the module is reloaded, so
+    pass a target relative to a baseline: `wait_for_attempts(attempts_done() + n, ...)`
+    with the baseline read before the jobs are enqueued.
+    """
+    with _attempts_cond:
+        return _attempts_cond.wait_for(lambda: _attempts_done >= count, timeout)
 
 
 def _claim_job(conn: sqlite3.Connection) -> Optional[Tuple[int, int, list, int, int]]:
@@ -91,15 +173,17 @@ def _claim_job(conn: sqlite3.Connection) -> Optional[Tuple[int, int, list, int,
     jid, partner_id, payload, attempts, max_attempts = row
     cur.execute("UPDATE partner_ingest_jobs SET status='in_progress', attempts = attempts + 1 WHERE id = ?", (jid,))
     conn.commit()
-    return jid, partner_id, json.loads(payload), attempts or 0, max_attempts or 5
+    return jid, partner_id, loads_json(payload), attempts or 0, max_attempts or 5
 
 
 def worker_loop(db_path: str, poll_interval: float = 0.1):
+    # audit rows are flushed in batches on the pool's writer thread
+    audit_pool = get_pool(db_path)
     while True:
         if _stop_event and _stop_event.is_set():
             break
         try:
-            conn = sqlite3.connect(db_path)
+            conn = open_connection(db_path)
             claimed = _claim_job(conn)
             if not claimed:
                 conn.close()
@@ -115,7 +199,7 @@ def worker_loop(db_path: str, poll_interval: float = 0.1):
                     cur.execute("UPDATE partner_ingest_jobs SET status='done', processed_at = CURRENT_TIMESTAMP WHERE id = ?", (jid,))
                     conn.commit()
                     incr("processed")
-                    record_audit(partner_id, None, "worker_processed_empty", payload=str(jid))
+                    record_audit_deferred(audit_pool, partner_id, None, "worker_processed_empty", payload=str(jid))
                 else:
                     # validate_products returns (valid_items, errors)
                     valid_items, validation_errors = validate_products(products)
@@ -125,15 +209,15 @@ def worker_loop(db_path: str, poll_interval: float = 0.1):
                         # If there are any validation errors, fail the job and persist diagnostics
                         logger.warning("Ingest validation failed for job=%s partner=%s errors=%s", jid, partner_id, validation_errors)
                         diag = {"accepted": 0, "rejected": len(validation_errors), "errors": validation_errors}
-                        djson = json.dumps(diag)
+                        djson = _dumps(diag)
                         try:
                             if len(djson) > 2000:
                                 odcur = conn.cursor()
                                 odcur.execute("INSERT INTO partner_ingest_diagnostics (job_id, diagnostics) VALUES (?, ?)", (jid, djson))
                                 off_id = odcur.lastrowid
-                                cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ?, diagnostics = ? WHERE id = ?", (json.dumps(validation_errors), json.dumps({"errors_link": f"/partner/diagnostics/{off_id}"}), jid))
+                                cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ?, diagnostics = ? WHERE id = ?", (_dumps(validation_errors), _dumps({"errors_link": f"/partner/diagnostics/{off_id}"}), jid))
                             else:
-                                cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ?, diagnostics = ? WHERE id = ?", (json.dumps(validation_errors), djson, jid))
+                                cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ?, diagnostics = ? WHERE id = ?", (_dumps(validation_errors), djson, jid))
                             conn.commit()
                         except sqlite3.OperationalError:
                             # If diagnostics column missing, offload diagnostics and
@@ -141,22 +225,22 @@ def worker_loop(db_path: str, poll_interval: float = 0.1):
                             odcur = conn.cursor()
                             odcur.execute("INSERT INTO partner_ingest_diagnostics (job_id, diagnostics) VALUES (?, ?)", (jid, djson))
                             off_id = odcur.lastrowid
-                            cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ? WHERE id = ?", (json.dumps(validation_errors), jid))
+                            cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ? WHERE id = ?", (_dumps(validation_errors), jid))
                             conn.commit()
 
-                        record_audit(partner_id, None, "worker_validation_failed", payload=json.dumps(validation_errors))
+                        record_audit_deferred(audit_pool, partner_id, None, "worker_validation_failed", payload=_dumps(validation_errors))
                     else:
                         upserted, upsert_errors = upsert_products(conn, valid_items, partner_id=partner_id)
                         logger.info("Ingest processed job=%s partner=%s upserted=%s errors=%s", jid, partner_id, upserted, upsert_errors)
                         diag = {"accepted": upserted, "rejected": len(upsert_errors), "errors": upsert_errors}
-                        djson = json.dumps(diag)
+                        djson = _dumps(diag)
                         # Offload large diagnostics to separate table to avoid bloating job rows
                         try:
                             if len(djson) > 2000:
                                 odcur = conn.cursor()
                                 odcur.execute("INSERT INTO partner_ingest_diagnostics (job_id, diagnostics) VALUES (?, ?)", (jid, djson))
                                 off_id = odcur.lastrowid
-                                cur.execute("UPDATE partner_ingest_jobs SET status='done', processed_at = CURRENT_TIMESTAMP, diagnostics = ? WHERE id = ?", (json.dumps({"errors_link": f"/partner/diagnostics/{off_id}"}), jid))
+                                cur.execute("UPDATE partner_ingest_jobs SET status='done', processed_at = CURRENT_TIMESTAMP, diagnostics = ? WHERE id = ?", (_dumps({"errors_link": f"/partner/diagnostics/{off_id}"}), jid))
                             else:
                                 cur.execute("UPDATE partner_ingest_jobs SET status='done', processed_at = CURRENT_TIMESTAMP, diagnostics = ? WHERE id = ?", (djson, jid))
                             conn.commit()
@@ -171,7 +255,7 @@ def worker_loop(db_path: str, poll_interval: float = 0.1):
                             conn.commit()
 
                         incr("processed")
-                        record_audit(partner_id, None, "worker_processed", payload=str(jid))
+                        record_audit_deferred(audit_pool, partner_id, None, "worker_processed", payload=str(jid))
             except Exception as e:
                 logger.exception("Ingest worker error for job %s: %s", jid, e)
                 cur = conn.cursor()
@@ -193,23 +277,27 @@ def worker_loop(db_path: str, poll_interval: float = 0.1):
                 else:
                     cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ? WHERE id = ?", (str(e), jid))
                 incr("failed")
-                record_audit(partner_id, None, "worker_exception", payload=str(e))
                 conn.commit()
+                # after commit, so the audit write isn't blocked by this transaction
+                record_audit_deferred(audit_pool, partner_id, None, "worker_exception", payload=str(e))
             finally:
                 conn.close()
+                _attempt_finished()
         except Exception:
             logger.exception("Worker outer exception")
             time.sleep(poll_interval)
 
 
 def start_worker(db_path: str) -> threading.Event:
+    """Start the background worker unless one is already running (idempotent)."""
     global _stop_event
-    if _stop_event and not _stop_event.is_set():
+    with _start_lock:
+        if _stop_event and not _stop_event.is_set():
+            return _stop_event
+        _stop_event = threading.Event()
+        t = threading.Thread(target=worker_loop, args=(db_path,), daemon=True)
+        t.start()
         return _stop_event
-    _stop_event = threading.Event()
-    t = threading.Thread(target=worker_loop, args=(db_path,), daemon=True)
-    t.start()
-    return _stop_event
 
 
 def stop_worker():
@@ -224,7 +312,9 @@ def process_next_job_once(db_path: str) -> Optional[Dict[str, Any]]:
     Returns a dict with job_id and final status, or None if no pending job
     was available.
     """
-    conn = sqlite3.connect(db_path)
+    # audits go through the pool's writer thread, as in worker_loop
+    audit_pool = get_pool(db_path)
+    conn = open_connection(db_path)
     try:
         claimed = _claim_job(conn)
         if not claimed:
@@ -235,50 +325,50 @@ def process_next_job_once(db_path: str) -> Optional[Dict[str, Any]]:
                 cur = conn.cursor()
                 cur.execute("UPDATE partner_ingest_jobs SET status='done', processed_at = CURRENT_TIMESTAMP WHERE id = ?", (jid,))
                 conn.commit()
-                record_audit(partner_id, None, "worker_processed_empty", payload=str(jid))
+                record_audit_deferred(audit_pool, partner_id, None, "worker_processed_empty", payload=str(jid))
                 return {"job_id": jid, "status": "done"}
 
             valid_items, validation_errors = validate_products(products)
             if validation_errors:
                 cur = conn.cursor()
                 diag = {"accepted": 0, "rejected": len(validation_errors), "errors": validation_errors}
-                djson = json.dumps(diag)
+                djson = _dumps(diag)
                 if len(djson) > 2000:
                     odcur = conn.cursor()
                     odcur.execute("INSERT INTO partner_ingest_diagnostics (job_id, diagnostics) VALUES (?, ?)", (jid, djson))
                     off_id = odcur.lastrowid
-                    cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ?, diagnostics = ? WHERE id = ?", (json.dumps(validation_errors), json.dumps({"errors_link": f"/partner/diagnostics/{off_id}"}), jid))
+                    cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ?, diagnostics = ? WHERE id = ?", (_dumps(validation_errors), _dumps({"errors_link": f"/partner/diagnostics/{off_id}"}), jid))
                     conn.commit()
-                    record_audit(partner_id, None, "worker_validation_failed", payload=json.dumps(validation_errors))
+                    record_audit_deferred(audit_pool, partner_id, None, "worker_validation_failed", payload=_dumps(validation_errors))
                     return {"job_id": jid, "status": "failed", "diagnostics": {"errors_link": f"/partner/diagnostics/{off_id}"}}
                 else:
-                    cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ?, diagnostics = ? WHERE id = ?", (json.dumps(validation_errors), djson, jid))
+                    cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ?, diagnostics = ? WHERE id = ?", (_dumps(validation_errors), djson, jid))
                     conn.commit()
-                    record_audit(partner_id, None, "worker_validation_failed", payload=json.dumps(validation_errors))
+                    record_audit_deferred(audit_pool, partner_id, None, "worker_validation_failed", payload=_dumps(validation_errors))
                     return {"job_id": jid, "status": "failed", "diagnostics": diag}
             else:
                 upserted, upsert_errors = upsert_products(conn, valid_items, partner_id=partner_id)
                 cur = conn.cursor()
                 diag = {"accepted": upserted, "rejected": len(upsert_errors), "errors": upsert_errors}
-                djson = json.dumps(diag)
+                djson = _dumps(diag)
                 if len(djson) > 2000:
                     odcur = conn.cursor()
                     odcur.execute("INSERT INTO partner_ingest_diagnostics (job_id, diagnostics) VALUES (?, ?)", (jid, djson))
                     off_id = odcur.lastrowid
-                    cur.execute("UPDATE partner_ingest_jobs SET status='done', processed_at = CURRENT_TIMESTAMP, diagnostics = ? WHERE id = ?", (json.dumps({"errors_link": f"/partner/diagnostics/{off_id}"}), jid))
+                    cur.execute("UPDATE partner_ingest_jobs SET status='done', processed_at = CURRENT_TIMESTAMP, diagnostics = ? WHERE id = ?", (_dumps({"errors_link": f"/partner/diagnostics/{off_id}"}), jid))
                     conn.commit()
-                    record_audit(partner_id, None, "worker_processed", payload=str(jid))
+                    record_audit_deferred(audit_pool, partner_id, None, "worker_processed", payload=str(jid))
                     return {"job_id": jid, "status": "done", "diagnostics": {"errors_link": f"/partner/diagnostics/{off_id}"}}
                 else:
                     cur.execute("UPDATE partner_ingest_jobs SET status='done', processed_at = CURRENT_TIMESTAMP, diagnostics = ? WHERE id = ?", (djson, jid))
                     conn.commit()
-                    record_audit(partner_id, None, "worker_processed", payload=str(jid))
+                    record_audit_deferred(audit_pool, partner_id, None, "worker_processed", payload=str(jid))
                     return {"job_id": jid, "status": "done", "diagnostics": diag}
         except Exception as e:
             cur = conn.cursor()
             cur.execute("UPDATE partner_ingest_jobs SET status='failed', error = ? WHERE id = ?", (str(e), jid))
             conn.commit()
-            record_audit(partner_id, None, "worker_exception", payload=str(e))
+            record_audit_deferred(audit_pool, partner_id, None, "worker_exception", payload=str(e))
             return {"job_id": jid, "status": "failed", "error": str(e)}
     finally:
         conn.close()
@@ -4,7 +4,7 @@ Provides a machine-readable contract and a small validator used by tests
 and the `/partner/contract/validate` sandbox endpoint.
 """
 from __future__ import annotations
-from typing import Dict, Any, List, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 
 CONTRACT = {
     "contract_version": "1.0",
@@ -28,15 +28,20 @@ def get_contract() -> Dict[str, Any]:
     return CONTRACT
 
 
-def validate_against_contract(items: List[Dict]) -> Tuple[List[Dict], List[str]]:
-    """A tiny validator returning (valid_items, errors).
+def validate_against_contract(items: List[Dict], max_errors: Optional[int] = None) -> Tuple[List[Dict], List[str], bool]:
+    """A tiny validator returning (valid_items, errors, truncated).
 
     This intentionally mirrors `validate_products` semantics but is
     lightweight and intended for partner consumption/sandbox validation.
+    With `max_errors`, validation stops once that many errors are collected,
+    so `valid_items` then only covers the items seen so far; `truncated` is
+    True only when items were left unchecked.
     """
     valid = []
     errors = []
     for i, it in enumerate(items):
+        if max_errors is not None and len(errors) >= max_errors:
+            return valid, errors, True
         try:
             name = (it.get("name") or "").strip()
             if not name:
@@ -66,4 +71,4 @@ def validate_against_contract(items: List[Dict]) -> Tuple[List[Dict], List[str]]
             })
         except Exception as e:
             errors.append(f"Item {i}: {e}")
-    return valid, errors
+    return valid, errors, False
@@ -0,0 +1,79 @@
+"""orjson-backed Flask JSON provider used when the partners blueprint is registered.
+
+Falls back to Flask's default (stdlib json) behaviour when orjson is not
+installed, when callers pass json-specific keyword arguments, or for values
+orjson cannot encode or decode (e.g. integers wider than 64 bits).
+"""
+from __future__ import annotations
+import json
+import re
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+if orjson is not None:
+    # Dates and dataclasses go through DefaultJSONProvider.default so the
+    # output matches Flask's (e.g. HTTP dates rather than ISO timestamps).
+    _OPTIONS = (
+        orjson.OPT_SORT_KEYS
+        | orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+    )
+    # Newer orjson rejects integers wider than 64 bits; older releases parse
+    # them as floats, losing precision, so those documents are sent to json.
+    _WIDE_INTS_AS_FLOAT = not isinstance(orjson.loads(b"18446744073709551617"), int)
+
+# a digit run that may not fit in 64 bits (also matches inside strings, which
+# only costs a stdlib parse)
+_WIDE_INT_BYTES = re.compile(rb"\d{20}|-\d{19}")
+_WIDE_INT_STR = re.compile(r"\d{20}|-\d{19}")
+
+
+def loads_json(data: str | bytes) -> Any:
+    """Parse JSON with orjson when available, else (or for wide integers) with json."""
+    if orjson is None:
+        return json.loads(data)
+    if _WIDE_INTS_AS_FLOAT:
+        pattern = _WIDE_INT_STR if isinstance(data, str) else _WIDE_INT_BYTES
+        if pattern.search(data):
+            return json.loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # json parses integers of any width and re-raises genuine syntax errors
+        return json.loads(data)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def _encode(self, obj: Any) -> bytes:
+        return orjson.dumps(obj, default=self.default, option=_OPTIONS)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        try:
+            return self._encode(obj).decode()
+        except TypeError:
+            return super().dumps(obj)
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return loads_json(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        # pretty-printed (debug) responses keep the stdlib path
+        if orjson is None or (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = self._encode(obj)
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
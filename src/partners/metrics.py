@@ -12,6 +12,7 @@ _counters: Dict[str, int] = {
     "processed": 0,
     "failed": 0,
     "retried": 0,
+    "deduplicated": 0,
 }
 
 
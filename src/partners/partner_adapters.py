@@ -1,14 +1,79 @@
 """Partner adapters for CSV and JSON feeds (normalized output).
 This module is used by src.partners.routes.py.
+
+Payloads may be bytes or a binary file-like object (e.g. the spooled upload
+from the ingest route), so large feeds do not have to be held in memory as
+one bytes object.
 """
 from __future__ import annotations
 import json
 import csv
-from io import StringIO
-from typing import List, Dict
+from io import BufferedReader, IOBase, RawIOBase, StringIO, TextIOWrapper
+from typing import BinaryIO, List, Dict, Union
+
+from .json_provider import loads_json, orjson
+
+Payload = Union[bytes, BinaryIO]
+
+
+class _ReadAdapter(RawIOBase):
+    """Raw-stream view over a file-like object outside the io hierarchy.
+
+    SpooledTemporaryFile only implements the io interface from Python 3.11,
+    so earlier versions can't be handed to TextIOWrapper directly. Closing
+    the adapter leaves the wrapped object open.
+    """
+
+    def __init__(self, f):
+        self._f = f
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._f.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    # the CSV sniffer rewinds after sampling
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        self._f.seek(pos, whence)
+        return self._f.tell()
 
-def parse_json_feed(payload: bytes) -> List[Dict]:
-    data = json.loads(payload.decode("utf-8"))
+    def tell(self) -> int:
+        return self._f.tell()
+
+
+def _text_stream(payload: Payload, encoding: str):
+    if isinstance(payload, (bytes, bytearray)):
+        return StringIO(payload.decode(encoding))
+    if not isinstance(payload, IOBase):
+        payload = BufferedReader(_ReadAdapter(payload))
+    return TextIOWrapper(payload, encoding=encoding, newline="")
+
+
+def _release(stream) -> None:
+    # leave the caller's binary stream open
+    if isinstance(stream, TextIOWrapper):
+        stream.detach()
+
+
+def _load_json(payload: Payload):
+    if orjson is not None:
+        # orjson parses UTF-8 bytes directly, skipping the str decode
+        return loads_json(payload if isinstance(payload, (bytes, bytearray)) else payload.read())
+    stream = _text_stream(payload, "utf-8")
+    try:
+        return json.load(stream)
+    finally:
+        _release(stream)
+
+
+def parse_json_feed(payload: Payload) -> List[Dict]:
+    data = _load_json(payload)
     out = []
     for item in data:
         sku = str(item.get("sku") or item.get("id") or "").strip()
@@ -58,21 +123,28 @@ def parse_json_feed(payload: bytes) -> List[Dict]:
         out.append(obj)
     return out
 
-def parse_csv_feed(payload: bytes) -> List[Dict]:
+def parse_csv_feed(payload: Payload) -> List[Dict]:
     # tolerate BOM and various delimiters (comma, semicolon, tab, pipe)
-    s = payload.decode("utf-8-sig")
-    # try to detect delimiter using csv.Sniffer; fall back to comma
+    stream = _text_stream(payload, "utf-8-sig")
+    try:
+        return _parse_csv_stream(stream)
+    finally:
+        _release(stream)
+
+
+def _parse_csv_stream(stream) -> List[Dict]:
+    # try to detect delimiter from the first two lines using csv.Sniffer; fall back to comma
+    sample = stream.readline() + stream.readline()
+    stream.seek(0)
     delimiter = ','
     try:
-        sample_lines = s.splitlines()
-        sample = '\n'.join(sample_lines[:2]) if sample_lines else s
         dialect = csv.Sniffer().sniff(sample, delimiters=[',', ';', '\t', '|'])
         delimiter = dialect.delimiter
     except Exception:
         # couldn't sniff reliably; keep comma
         delimiter = ','
 
-    reader = csv.DictReader(StringIO(s), delimiter=delimiter)
+    reader = csv.DictReader(stream, delimiter=delimiter)
     out = []
     for row in reader:
         # prefer explicit price_cents, then price. Keep raw if parsing fails so
@@ -118,7 +190,7 @@ def parse_csv_feed(payload: bytes) -> List[Dict]:
 # XML adapter removed in moderate prune; keep JSON and CSV only
 
 
-def parse_feed(payload: bytes, content_type: str = "application/json", feed_version: str | None = None) -> List[Dict]:
+def parse_feed(payload: Payload, content_type: str = "application/json", feed_version: str | None = None) -> List[Dict]:
     """Dispatch to the appropriate adapter based on content type and optional feed_version.
 
     This keeps a single call site for routes and allows future versioned
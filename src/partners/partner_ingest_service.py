@@ -4,116 +4,376 @@ This module provides a safer upsert that:
 - matches by SKU when provided
 - falls back to matching by name
 - uses a transaction for the entire batch and reports per-item errors
+
+Product ids for a whole batch are resolved with set-based `IN (...)` lookups
+on SKU and on case- and whitespace-insensitive name (served by the non-unique
+`idx_product_norm_name` index), and the batch is then written with a single
+`INSERT ... ON CONFLICT(id) DO UPDATE` statement via `executemany`. Name
+matching stays a lookup rather than a unique constraint, so product names
+that differ only in case may still coexist. The SELECT-then-branch path
+remains for SQLite < 3.24 and to attribute database errors to single items.
 """
 from __future__ import annotations
-from typing import List, Dict, Tuple
+from typing import Iterator, List, Dict, Tuple, Optional, Union
 import sqlite3
+import string
+from contextlib import contextmanager
+from .db import IngestConnectionPool
+
+# Minimum batch size for upsert_products(bulk_mode=True) to drop and rebuild
+# the secondary product indexes
+BULK_INDEX_THRESHOLD = 50_000
+
+_UPSERT_SET = "price_cents = excluded.price_cents, stock = excluded.stock, active = 1"
+# Price is bound as (price_cents, price); dollar prices are converted to cents
+# by SQLite instead of per item in Python. Unparseable/missing prices become 0.
+_PRICE_EXPR = "COALESCE(?, CAST(ROUND(? * 100) AS INTEGER), 0)"
+
+# Keys per IN (...) lookup, below SQLite's historical 999-variable limit
+_LOOKUP_CHUNK = 500
+# lower(trim(name)) in Python: SQLite's lower() only folds ASCII letters
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+# Idempotency hashes carry an algorithm prefix; rows recorded before the
+# prefix existed are bare sha256 hex digests.
+FEED_HASH_PREFIX = "b2:"
+_PREFIX_END = FEED_HASH_PREFIX[:-1] + chr(ord(FEED_HASH_PREFIX[-1]) + 1)
+_SQL_FEED_IMPORTED = "SELECT 1 FROM partner_feed_imports WHERE partner_id = ? AND feed_hash = ?"
+_SQL_HAS_LEGACY_IMPORTS = (
+    "SELECT 1 FROM partner_feed_imports WHERE partner_id = ? AND feed_hash < ? "
+    "UNION ALL SELECT 1 FROM partner_feed_imports WHERE feed_hash >= ? AND partner_id = ? LIMIT 1"
+)
+
+# Compiled statements per product schema shape: (columns, indexes) ->
+# (upsert_sql or None, insert_sql, with_sku). Built once per shape instead of probing
+# the schema with a failing INSERT on every batch. upsert_sql takes the matched
+# product id (or None for a new row) as its first parameter.
+_Statements = Tuple[Optional[str], str, bool]
+_STMT_CACHE: Dict[Tuple[frozenset, frozenset], _Statements] = {}
+
+
+def _schema_key(conn: sqlite3.Connection) -> Tuple[frozenset, frozenset]:
+    cols = frozenset(r[1] for r in conn.execute("PRAGMA table_info(product)").fetchall())
+    # only unique indexes can serve as ON CONFLICT targets
+    indexes = frozenset(r[1] for r in conn.execute("PRAGMA index_list(product)").fetchall() if r[2])
+    return cols, indexes
+
+
+def _statements(conn: sqlite3.Connection) -> _Statements:
+    """Return (upsert_sql, insert_sql, with_sku) for the connection's product schema."""
+    key = _schema_key(conn)
+    stmts = _STMT_CACHE.get(key)
+    if stmts is None:
+        stmts = _STMT_CACHE[key] = _compile_statements(*key)
+    return stmts
+
+
+def _compile_statements(cols: frozenset, indexes: frozenset) -> _Statements:
+    insert_cols = ["name", "price_cents", "stock", "active"]
+    values = ["?", _PRICE_EXPR, "?", "1"]
+    with_sku = "sku" in cols
+    if with_sku:
+        insert_cols.append("sku")
+        values.append("?")
+    insert_sql = f"INSERT INTO product ({', '.join(insert_cols)}) VALUES ({', '.join(values)})"
+    return _upsert_sql(insert_cols, values), insert_sql, with_sku
+
+
+def _upsert_sql(insert_cols: List[str], values: List[str]) -> Optional[str]:
+    """Return the single-statement UPSERT keyed on the resolved product id.
+
+    Returns None when SQLite is too old for ON CONFLICT DO UPDATE, in which
+    case callers use the legacy path.
+    """
+    if sqlite3.sqlite_version_info < (3, 24, 0):
+        return None
+    return (
+        f"INSERT INTO product (id, {', '.join(insert_cols)}) VALUES (?, {', '.join(values)}) "
+        f"ON CONFLICT(id) DO UPDATE SET {_UPSERT_SET}"
+    )
+
+
+def _price_params(p: Dict) -> Tuple[Optional[int], object]:
+    # Support either price_cents (int) or price (float) from adapters; the
+    # dollar value is passed through raw for _PRICE_EXPR to convert
+    if "price_cents" in p:
+        return int(p.get("price_cents", 0)), None
+    return None, p.get("price")
+
+
+def _record_feed_import(conn: sqlite3.Connection, partner_id: int | None, feed_hash: str | None) -> None:
+    if not (partner_id and feed_hash):
+        return
+    try:
+        conn.execute("INSERT INTO partner_feed_imports (partner_id, feed_hash) VALUES (?, ?)", (partner_id, feed_hash))
+    except sqlite3.IntegrityError:
+        # duplicate entry - ignore
+        pass
+
+
+def needs_legacy_feed_hash(conn: sqlite3.Connection, partner_id: int | None, feed_hash: str | None) -> bool:
+    """Whether the feed's legacy sha256 digest must be computed to check idempotency.
+
+    Only when `feed_hash` itself is not recorded and the partner still has
+    imports recorded under a bare (unprefixed) digest.
+    """
+    if not (partner_id and feed_hash):
+        return False
+    try:
+        if conn.execute(_SQL_FEED_IMPORTED, (partner_id, feed_hash)).fetchone():
+            return False
+        # two index ranges on (partner_id, feed_hash) around the prefixed keys
+        return conn.execute(_SQL_HAS_LEGACY_IMPORTS, (partner_id, FEED_HASH_PREFIX, _PREFIX_END, partner_id)).fetchone() is not None
+    except sqlite3.OperationalError:
+        return False
+
 
+def _already_imported(conn: Union[sqlite3.Connection, IngestConnectionPool], partner_id: int | None, feed_hash: str | None, legacy_feed_hash: str | None = None) -> bool:
+    if not (partner_id and feed_hash):
+        return False
+    # feeds imported before the hash scheme changed are recorded under
+    # their legacy digest; either one marks the feed as processed
+    hashes = (feed_hash, legacy_feed_hash or feed_hash)
+    sql = "SELECT 1 FROM partner_feed_imports WHERE partner_id = ? AND feed_hash IN (?, ?) LIMIT 1"
+    try:
+        if isinstance(conn, IngestConnectionPool):
+            with conn.reader() as rconn:
+                return rconn.execute(sql, (partner_id, *hashes)).fetchone() is not None
+        return conn.execute(sql, (partner_id, *hashes)).fetchone() is not None
+    except sqlite3.OperationalError:
+        # table may not exist if schema not updated
+        return False
 
-def upsert_products(conn: sqlite3.Connection, products: List[Dict], partner_id: int | None = None, feed_hash: str | None = None) -> Tuple[int, List[str]]:
+
+def upsert_products(conn: Union[sqlite3.Connection, IngestConnectionPool], products: List[Dict], partner_id: int | None = None, feed_hash: str | None = None, bulk_mode: bool = False, commit: bool = True, legacy_feed_hash: str | None = None) -> Tuple[int, List[str]]:
     """Upsert normalized product dicts into product table.
 
+    `conn` may be a plain connection or an IngestConnectionPool; with a pool
+    the idempotency check runs on a read-only connection and the batch on
+    the pool's writer.
+
+    With `bulk_mode` (initial catalog loads) batches of at least
+    BULK_INDEX_THRESHOLD items drop the non-unique product indexes first and
+    rebuild them afterwards; the unique indexes and the normalized-name
+    lookup index stay in place. The rebuild is part of the same transaction,
+    so it is committed with the batch (or left open when commit=False).
+
+    The batch and its partner_feed_imports row are committed together. Pass
+    commit=False with a plain connection to leave the transaction open so
+    the caller can add its own statements (e.g. the audit row) before
+    committing once.
+
+    `legacy_feed_hash` is the same feed's digest under the previous hashing
+    scheme; a feed recorded under either digest is skipped. Callers only
+    need to compute it when needs_legacy_feed_hash() says so.
+
     Returns (count_upserted, errors)
     """
-    upserted = 0
-    errors: List[str] = []
-    cur = conn.cursor()
     # Check idempotency: if partner_id and feed_hash provided and exists, skip
-    if partner_id and feed_hash:
+    if _already_imported(conn, partner_id, feed_hash, legacy_feed_hash):
+        return 0, ["Feed already processed"]
+    if isinstance(conn, IngestConnectionPool):
+        with conn.writer() as wconn:
+            return _upsert_plain_rows(wconn, products, partner_id=partner_id, feed_hash=feed_hash, bulk_mode=bulk_mode)
+    result = _upsert_plain_rows(conn, products, partner_id=partner_id, feed_hash=feed_hash, bulk_mode=bulk_mode)
+    if commit:
+        conn.commit()
+    return result
+
+
+def _upsert_plain_rows(conn: sqlite3.Connection, products: List[Dict], partner_id: int | None = None, feed_hash: str | None = None, bulk_mode: bool = False) -> Tuple[int, List[str]]:
+    # Callers may have set sqlite3.Row globally; lookups here only need bare
+    # tuples, so skip the per-row Row allocation for the duration of the batch
+    saved_factory = conn.row_factory
+    conn.row_factory = None
+    try:
+        if bulk_mode and len(products) >= BULK_INDEX_THRESHOLD:
+            with _without_secondary_indexes(conn):
+                return _upsert_batch(conn, products, partner_id=partner_id, feed_hash=feed_hash)
+        return _upsert_batch(conn, products, partner_id=partner_id, feed_hash=feed_hash)
+    finally:
+        conn.row_factory = saved_factory
+
+
+@contextmanager
+def _savepoint(conn: sqlite3.Connection, name: str) -> Iterator[None]:
+    """Scope the block's writes so a failure undoes only them.
+
+    Runs inside the caller's transaction (opening one if needed), which is
+    left for the caller to commit or roll back.
+    """
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute(f"SAVEPOINT {name}")
+    try:
+        yield
+    except BaseException:
+        conn.execute(f"ROLLBACK TO {name}")
+        conn.execute(f"RELEASE {name}")
+        raise
+    conn.execute(f"RELEASE {name}")
+
+
+@contextmanager
+def _without_secondary_indexes(conn: sqlite3.Connection) -> Iterator[None]:
+    """Drop non-unique product indexes for the block and rebuild them after.
+
+    Rebuilding sorts once instead of splitting B-tree pages on every insert.
+    Drop, batch and rebuild run under one savepoint in the caller's
+    transaction: if the block raises, only its writes and the DROPs are
+    undone, and committing is left to the caller.
+    """
+    # idx_product_norm_name stays: every item is matched through it
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'product' "
+        "AND sql IS NOT NULL AND sql NOT LIKE 'CREATE UNIQUE%' AND name != 'idx_product_norm_name'"
+    ).fetchall()
+    with _savepoint(conn, "bulk_indexes"):
+        for name, _ in indexes:
+            conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+        yield
+        for _, sql in indexes:
+            conn.execute(sql)
+
+
+def _upsert_batch(conn: sqlite3.Connection, products: List[Dict], partner_id: int | None = None, feed_hash: str | None = None) -> Tuple[int, List[str]]:
+    """Write already-validated items (see validate_products) in one batch.
+
+    Items are expected to be validated already, so only database errors are
+    handled here; those undo the batch (not the caller's transaction) and
+    the items are retried one by one to attribute the failure.
+    """
+    stmts = _statements(conn)
+    sql, _, with_sku = stmts
+    if sql is not None:
         try:
-            r = cur.execute("SELECT 1 FROM partner_feed_imports WHERE partner_id = ? AND feed_hash = ? LIMIT 1", (partner_id, feed_hash)).fetchone()
-            if r:
-                return 0, ["Feed already processed"]
-        except sqlite3.OperationalError:
-            # table may not exist if schema not updated
+            with _savepoint(conn, "upsert_batch"):
+                conn.executemany(sql, _batch_rows(conn, products, with_sku))
+        except sqlite3.Error:
+            # A bad row aborts the whole statement; let the per-item path
+            # report which items failed.
             pass
+        else:
+            if products:
+                _record_feed_import(conn, partner_id, feed_hash)
+            return len(products), []
+
+    return _upsert_products_legacy(conn, products, partner_id=partner_id, feed_hash=feed_hash, stmts=stmts)
+
+
+def _ids_by(conn: sqlite3.Connection, expr: str, keys: set) -> Dict[str, int]:
+    """Map each key to the lowest product id whose `expr` equals it."""
+    found: Dict[str, int] = {}
+    keys = list(keys)
+    for i in range(0, len(keys), _LOOKUP_CHUNK):
+        chunk = keys[i:i + _LOOKUP_CHUNK]
+        sql = f"SELECT {expr}, id FROM product WHERE {expr} IN ({', '.join('?' * len(chunk))}) ORDER BY id DESC"
+        found.update(conn.execute(sql, chunk))
+    return found
+
+
+def _batch_rows(conn: sqlite3.Connection, products: List[Dict], with_sku: bool) -> Iterator[tuple]:
+    """Resolve every item's product id up front, then stream the UPSERT rows.
+
+    Items match like on the item-by-item path: by SKU, then by normalized
+    name, against existing rows and against products created earlier in the
+    batch. Items matching a product created earlier in the batch are merged
+    into its insert, the later price and stock winning.
+    """
+    items = []
+    for p in products:
+        name = (p.get("name") or "").strip()
+        sku = (p.get("sku") or "").strip() if with_sku else ""
+        items.append((p, name, sku, name.translate(_ASCII_LOWER)))
+    by_sku = _ids_by(conn, "sku", {sku for _, _, sku, _ in items if sku})
+    by_name = _ids_by(conn, "lower(trim(name))", {key for _, _, _, key in items})
+
+    # Per item: ("id", product id) to update, ("new", index of the last item
+    # merged into it) to insert, or None when merged into an earlier insert
+    targets: List[Optional[Tuple[str, int]]] = []
+    # products this batch creates: sku / normalized name -> creating item
+    new_by_sku: Dict[str, int] = {}
+    new_by_name: Dict[str, int] = {}
+    for i, (_, _, sku, key) in enumerate(items):
+        prod_id = by_sku.get(sku) if sku else None
+        creator = new_by_sku.get(sku) if sku and prod_id is None else None
+        if prod_id is None and creator is None:
+            prod_id = by_name.get(key)
+            if prod_id is None:
+                creator = new_by_name.get(key)
+        if prod_id is not None:
+            targets.append(("id", prod_id))
+        elif creator is not None:
+            targets[creator] = ("new", i)
+            targets.append(None)
+        else:
+            targets.append(("new", i))
+            new_by_name[key] = i
+            if sku:
+                new_by_sku[sku] = i
+
+    for (p, name, sku, _), target in zip(items, targets):
+        if target is None:
+            continue
+        kind, ref = target
+        if kind == "new":
+            # price and stock of the last item merged into this insert
+            prod_id, p = None, items[ref][0]
+        else:
+            prod_id = ref
+        yield (prod_id, name, *_price_params(p), int(p.get("stock", 0))) + ((sku or None,) if with_sku else ())
+
+
+def _lookup_product_id(cur: sqlite3.Cursor, sku: str, name: str) -> Optional[int]:
+    # Prefer matching by sku if present, otherwise match by name
+    # Use case- and whitespace-insensitive name match to avoid missing existing products
+    if sku:
+        r = cur.execute("SELECT id FROM product WHERE sku = ?", (sku,)).fetchone()
+        if r:
+            return r[0]
+    r = cur.execute("SELECT id FROM product WHERE lower(trim(name)) = lower(trim(?))", (name,)).fetchone()
+    return r[0] if r else None
+
+
+def _upsert_products_legacy(conn: sqlite3.Connection, products: List[Dict], partner_id: int | None = None, feed_hash: str | None = None, stmts: _Statements | None = None) -> Tuple[int, List[str]]:
+    """SELECT-then-INSERT/UPDATE path for SQLite builds without UPSERT support.
+
+    Also serves as the per-item retry when the batch statement fails, so
+    only database errors are caught and reported per item.
+    """
+    _, insert_sql, with_sku = stmts or _statements(conn)
+    upserted = 0
+    errors: List[str] = []
+    cur = conn.cursor()
     try:
-        for idx, p in enumerate(products):
-            try:
-                sku = (p.get("sku") or "").strip()
+        # a batch-level failure undoes these items only, not the caller's work
+        with _savepoint(conn, "upsert_items"):
+            for idx, p in enumerate(products):
+                sku = (p.get("sku") or "").strip() if with_sku else ""
                 name = (p.get("name") or "").strip()
-                # Support either price_cents (int) or price (float) from adapters
-                if "price_cents" in p:
-                    price_cents = int(p.get("price_cents", 0))
-                else:
-                    # convert dollars to cents
-                    price_val = p.get("price", 0)
-                    try:
-                        price_cents = int(round(float(price_val) * 100))
-                    except Exception:
-                        price_cents = 0
+                price = _price_params(p)
                 stock = int(p.get("stock", 0))
-
-                # Prefer matching by sku if present (if schema supports it), otherwise match by name
-                # Use case- and whitespace-insensitive name match to avoid missing existing products
-                prod_id = None
-                if sku:
-                    try:
-                        r2 = cur.execute("SELECT id FROM product WHERE sku = ?", (sku,)).fetchone()
-                        if r2:
-                            prod_id = r2[0]
-                    except sqlite3.OperationalError:
-                        # sku column not present; fall back to name
-                        prod_id = None
-                if not prod_id:
-                    # normalize name lookup to lower(trim(name)) to match ingest normalization
-                    try:
-                        r = cur.execute("SELECT id FROM product WHERE lower(trim(name)) = lower(trim(?))", (name,)).fetchone()
-                    except sqlite3.OperationalError:
-                        # fallback to exact match if lower/trim unsupported for some reason
-                        r = cur.execute("SELECT id FROM product WHERE name = ?", (name,)).fetchone()
-                    if r:
-                        prod_id = r[0]
-
-                if prod_id:
-                    cur.execute(
-                        "UPDATE product SET price_cents = ?, stock = ?, active = 1 WHERE id = ?",
-                        (price_cents, stock, prod_id),
-                    )
-                else:
-                    # Attempt to insert; if schema includes sku, try to insert sku column
-                    try:
-                        cur.execute(
-                            "INSERT INTO product (name, price_cents, stock, active, sku) VALUES (?, ?, ?, 1, ?)",
-                            (name, price_cents, stock, sku if sku else None),
-                        )
-                    except sqlite3.OperationalError:
-                        # fallback if sku column not present
+                try:
+                    prod_id = _lookup_product_id(cur, sku, name)
+                    if prod_id:
                         cur.execute(
-                            "INSERT INTO product (name, price_cents, stock, active) VALUES (?, ?, ?, 1)",
-                            (name, price_cents, stock),
+                            f"UPDATE product SET price_cents = {_PRICE_EXPR}, stock = ?, active = 1 WHERE id = ?",
+                            (*price, stock, prod_id),
                         )
+                    else:
+                        params = (name, *price, stock)
+                        cur.execute(insert_sql, params + (sku or None,) if with_sku else params)
+                except sqlite3.IntegrityError as e:
+                    errors.append(f"Item {idx} error: {e}")
+                    continue
                 upserted += 1
-            except Exception as e:
-                errors.append(f"Item {idx} error: {e}")
-                conn.commit()
-                # record feed import if provided
-                if partner_id and feed_hash:
-                    try:
-                        cur.execute("INSERT INTO partner_feed_imports (partner_id, feed_hash) VALUES (?, ?)", (partner_id, feed_hash))
-                        conn.commit()
-                    except sqlite3.IntegrityError:
-                        # ignore duplicate
-                        pass
-    except Exception as e:
-        conn.rollback()
+    except sqlite3.Error as e:
         errors.append(f"Batch error: {e}")
-        return upserted, errors
-
-    # commit the successful transaction
-    try:
-        conn.commit()
-    except Exception:
-        conn.rollback()
+        return 0, errors
 
     # record partner_feed_imports if provided and at least one item upserted
-    if partner_id and feed_hash and upserted > 0:
-        try:
-            cur.execute("INSERT INTO partner_feed_imports (partner_id, feed_hash) VALUES (?, ?)", (partner_id, feed_hash))
-            conn.commit()
-        except sqlite3.IntegrityError:
-            # duplicate entry - ignore
-            pass
+    if upserted > 0:
+        _record_feed_import(conn, partner_id, feed_hash)
 
     return upserted, errors
 
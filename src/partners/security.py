@@ -1,81 +1,126 @@
 from __future__ import annotations
+import hashlib
+import hmac
 import time
 import threading
 import sqlite3
-from typing import Optional
+from collections import deque
+from typing import Deque, Dict, Optional
 from pathlib import Path
 import os
 
-# Simple in-memory rate limiter per API key (token bucket-like)
+from .db import get_pool
+
+# Simple in-memory token-bucket rate limiter per endpoint scope and API key:
+# (scope, api_key) -> (tokens, last_refill_monotonic)
 _limits: dict = {}
 _lock = threading.Lock()
-_inflight: set = set()
+# A bucket refills completely in 60s whatever the limit, so entries idle that
+# long behave exactly like missing ones and can be dropped. Sweep once the
+# table grows past this many keys.
+RATE_LIMIT_SWEEP_AT = 10_000
+_sweep_at = RATE_LIMIT_SWEEP_AT
+
+
+def _sweep_idle_buckets(now: float) -> None:
+    global _sweep_at
+    idle = [k for k, (_, ts) in _limits.items() if now - ts >= 60.0]
+    for k in idle:
+        del _limits[k]
+    # amortize: the next sweep waits until the live set has doubled
+    _sweep_at = max(RATE_LIMIT_SWEEP_AT, 2 * len(_limits))
+
+
+_DEFAULT_DB = str(Path(__file__).resolve().parents[2] / "app.sqlite")
 
 
 def _get_db_path() -> str:
-    root = Path(__file__).resolve().parents[2]
-    return str(Path(os.environ.get("APP_DB_PATH") or root / "app.sqlite"))
+    return os.environ.get("APP_DB_PATH") or _DEFAULT_DB
 
 
-def check_rate_limit(api_key: str, max_per_minute: int = 60) -> bool:
-    now = int(time.time())
-    window = now // 60
-    with _lock:
-        entry = _limits.get(api_key)
-        if not entry or entry[0] != window:
-            _limits[api_key] = (window, 1)
-            return True
-        if entry[1] < max_per_minute:
-            _limits[api_key] = (entry[0], entry[1] + 1)
-            return True
-        return False
-
-
-def try_acquire_inflight(api_key: str) -> bool:
-    """Attempt to reserve an inflight slot for this API key.
-
-    Returns True if the slot was acquired, False if another request is
-    already in progress for the same key. This is a lightweight in-process
-    guard intended for demos to avoid concurrent writes to SQLite.
+def take_rate_token(api_key: str, max_per_minute: int = 60, scope: str = "ingest") -> float:
+    """Take one token from the key's bucket for `scope`.
+
+    Each (scope, api_key) pair has its own bucket, so endpoints with
+    different limits don't drain each other. The bucket holds up to
+    `max_per_minute` tokens and refills continuously at max_per_minute/60
+    tokens per second. Returns 0.0 when the request is allowed, otherwise
+    the number of seconds until a token is available.
     """
+    rate = max_per_minute / 60.0
+    now = time.monotonic()
+    bucket = (scope, api_key)
     with _lock:
-        if api_key in _inflight:
-            return False
-        _inflight.add(api_key)
-        return True
+        tokens, ts = _limits.get(bucket, (float(max_per_minute), now))
+        tokens = min(float(max_per_minute), tokens + (now - ts) * rate)
+        if tokens < 1.0:
+            _limits[bucket] = (tokens, now)
+            return (1.0 - tokens) / rate
+        _limits[bucket] = (tokens - 1.0, now)
+        if len(_limits) > _sweep_at:
+            _sweep_idle_buckets(now)
+        return 0.0
 
 
-def release_inflight(api_key: str) -> None:
-    """Release a previously-acquired inflight slot for the API key."""
-    with _lock:
-        try:
-            _inflight.remove(api_key)
-        except KeyError:
-            pass
+def check_rate_limit(api_key: str, max_per_minute: int = 60, scope: str = "ingest") -> bool:
+    return take_rate_token(api_key, max_per_minute, scope) == 0.0
+
+
+AUDIT_SQL = "INSERT INTO partner_ingest_audit (partner_id, api_key, action, payload) VALUES (?, ?, ?, ?)"
+
 
+# Deferred audit rows waiting for their pool's writer thread. The first row
+# for a pool schedules one flush; rows arriving before it runs join the same
+# executemany, so bursts of audits share one transaction.
+_audit_pending: Dict[object, Deque[tuple]] = {}
+_audit_lock = threading.Lock()
+# Rows held per pool while its writer is busy; past this the oldest are
+# dropped (audits are best-effort) so a stalled writer can't grow memory.
+AUDIT_PENDING_MAX = 10_000
 
-def record_audit(partner_id: Optional[int], api_key: Optional[str], action: str, payload: Optional[str] = None):
-    db = _get_db_path()
+
+def _flush_audits(pool, conn: sqlite3.Connection) -> None:
+    with _audit_lock:
+        rows = _audit_pending.pop(pool, ())
+    conn.executemany(AUDIT_SQL, rows)
+
+
+def record_audit_deferred(pool, partner_id: Optional[int], api_key: Optional[str], action: str, payload: Optional[str] = None) -> None:
+    """Queue an audit row on the pool's writer thread without waiting for it.
+
+    Like record_audit this is best-effort: failures are not reported.
+    """
+    row = (partner_id, api_key, action, payload)
+    with _audit_lock:
+        rows = _audit_pending.get(pool)
+        if rows is not None:
+            # a full deque drops its oldest row
+            rows.append(row)
+            return
+        _audit_pending[pool] = deque([row], maxlen=AUDIT_PENDING_MAX)
+    try:
+        pool.submit_write_fn(lambda conn: _flush_audits(pool, conn))
+    except Exception:
+        with _audit_lock:
+            _audit_pending.pop(pool, None)
+
+
+def record_audit(partner_id: Optional[int], api_key: Optional[str], action: str, payload: Optional[str] = None, conn: Optional[sqlite3.Connection] = None):
     # For tests and local debugging we record the raw api_key. In a
     # production setting you may want to store a masked version instead.
     # Keep mask_key available for future use.
     safe_key = api_key
+    if conn is not None:
+        # part of the caller's transaction; the caller commits
+        conn.execute(AUDIT_SQL, (partner_id, safe_key, action, payload))
+        return
     try:
-        conn = sqlite3.connect(db)
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO partner_ingest_audit (partner_id, api_key, action, payload) VALUES (?, ?, ?, ?)",
-            (partner_id, safe_key, action, payload),
-        )
-        conn.commit()
+        # pooled writer for the current DB instead of a connection per call
+        with get_pool(_get_db_path()).writer() as conn:
+            conn.execute(AUDIT_SQL, (partner_id, safe_key, action, payload))
     except Exception:
         # best-effort logging; don't crash the app
         pass
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
 
 def mask_key(api_key: Optional[str]) -> Optional[str]:
@@ -86,12 +131,38 @@ def mask_key(api_key: Optional[str]) -> Optional[str]:
     """
     if not api_key:
         return None
-    try:
-        if len(api_key) <= 8:
-            return api_key[:4] + "..."
-        return api_key[:6] + "..."
-    except Exception:
-        return None
+    return api_key[:4 if len(api_key) <= 8 else 6] + "..."
+
+
+# Candidate keys are narrowed by a short prefix (indexed by
+# ix_api_keys_prefix) and the full key is compared in Python in constant time,
+# so neither the query nor the comparison exits early on a partial match.
+KEY_PREFIX_LEN = 4
+SQL_KEYS_BY_PREFIX = "SELECT partner_id, api_key FROM partner_api_keys WHERE substr(api_key, 1, 4) = ?"
+
+
+def lookup_partner_id(conn: sqlite3.Connection, api_key: str) -> Optional[int]:
+    """Return the partner_id for api_key using an open connection, or None.
+
+    Stored keys are SHA-256 hashed when HASH_KEYS=true is set in env.
+    """
+    stored_key = hash_key_for_storage(api_key) if hash_keys_enabled() else api_key
+    expected = stored_key.encode()
+    partner_id = None
+    # no early break: every candidate is compared
+    for pid, candidate in conn.execute(SQL_KEYS_BY_PREFIX, (stored_key[:KEY_PREFIX_LEN],)):
+        if hmac.compare_digest(str(candidate).encode(), expected):
+            partner_id = pid
+    return partner_id
+
+
+# Issued keys are short ASCII tokens; anything else can't match a stored key
+API_KEY_MAX_LEN = 256
+
+
+def plausible_api_key(api_key: Optional[str]) -> bool:
+    """Cheap format check run before any lookup (no DB access)."""
+    return bool(api_key) and len(api_key) <= API_KEY_MAX_LEN and api_key.isascii()
 
 
 def verify_api_key(db_path: Optional[str], api_key: str) -> Optional[int]:
@@ -100,40 +171,24 @@ def verify_api_key(db_path: Optional[str], api_key: str) -> Optional[int]:
     This helper supports plain-text keys for demo. Production should store
     hashed keys and use a constant-time compare.
     """
+    if not plausible_api_key(api_key):
+        return None
     try:
-        if not db_path:
-            root = Path(__file__).resolve().parents[2]
-            db_path = str(Path(os.environ.get("APP_DB_PATH") or root / "app.sqlite"))
-        conn = sqlite3.connect(db_path)
-        cur = conn.cursor()
-        # Support optional hashed keys in DB when HASH_KEYS=true is set in env.
-        hash_keys = os.environ.get("HASH_KEYS", "false").lower() in ("1", "true", "yes")
-        if hash_keys:
-            # Stored keys are hashed; compute hash of provided key and compare
-            import hashlib
-
-            h = hashlib.sha256(api_key.encode()).hexdigest()
-            cur.execute("SELECT partner_id FROM partner_api_keys WHERE api_key = ?", (h,))
-            row = cur.fetchone()
-            if row:
-                return row[0]
-        else:
-            cur.execute("SELECT partner_id FROM partner_api_keys WHERE api_key = ?", (api_key,))
-            row = cur.fetchone()
-            if row:
-                return row[0]
+        with get_pool(db_path or _get_db_path()).reader() as conn:
+            return lookup_partner_id(conn, api_key)
     except Exception:
-        pass
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
-    return None
+        return None
+
+
+# Accepted spellings for boolean flags (?async=, HASH_KEYS)
+TRUTHY = frozenset({"1", "true", "yes", "on", "y"})
+
+
+def hash_keys_enabled() -> bool:
+    """Whether partner keys are stored hashed (HASH_KEYS); read on every call."""
+    return os.environ.get("HASH_KEYS", "false").lower() in TRUTHY
 
 
 def hash_key_for_storage(api_key: str) -> str:
     """Return a deterministic SHA256 hex digest for storage when hashing is enabled."""
-    import hashlib
-
     return hashlib.sha256(api_key.encode()).hexdigest()
@@ -1,22 +1,53 @@
 """Test helpers: create an isolated sqlite DB from schema and seed test data."""
 from pathlib import Path
+import atexit
+import shutil
 import sqlite3
 import os
+import tempfile
+import threading
+from typing import Optional
 
+from .db import open_connection
 
-def create_test_db(db_path: str):
-    """Create a sqlite DB at db_path and initialize schema from db/init.sql."""
-    root = Path(__file__).resolve().parents[2]
-    schema_file = root / "db" / "init.sql"
+
+_SCHEMA_FILE = Path(__file__).resolve().parents[2] / "db" / "init.sql"
+# Schema-only database built once per process; create_test_db copies it
+# instead of re-running the DDL for every test database.
+_template: Optional[str] = None
+_template_lock = threading.Lock()
+
+
+def _load_schema(db_path: str) -> None:
+    schema_file = _SCHEMA_FILE
     if not schema_file.exists():
         raise FileNotFoundError("db/init.sql not found")
     with open(schema_file, "r", encoding="utf-8") as f:
         sql = f.read()
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.executescript(sql)
-    conn.commit()
-    conn.close()
+    # WAL/synchronous=NORMAL as the app uses; the schema commits once
+    conn = open_connection(db_path)
+    try:
+        conn.executescript("BEGIN;\n" + sql + "\nCOMMIT;")
+    finally:
+        # closing checkpoints the WAL, so the main file alone is complete
+        conn.close()
+
+
+def _schema_template() -> str:
+    global _template
+    with _template_lock:
+        if _template is None:
+            tmpdir = tempfile.mkdtemp(prefix="partners-schema-")
+            atexit.register(shutil.rmtree, tmpdir, ignore_errors=True)
+            path = os.path.join(tmpdir, "template.sqlite")
+            _load_schema(path)
+            _template = path
+        return _template
+
+
+def create_test_db(db_path: str):
+    """Create a sqlite DB at db_path and initialize schema from db/init.sql."""
+    shutil.copyfile(_schema_template(), db_path)
 
 
 def seed_partner_and_key(db_path: str, partner_name: str = "test-partner", api_key: str = "test-key") -> int:
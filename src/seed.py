@@ -10,6 +10,9 @@ def get_connection(db_path):
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
+    # same settings as the app's pooled writer (src/partners/db.py)
+    for pragma in ("journal_mode=WAL", "synchronous=NORMAL", "busy_timeout=5000", "temp_store=MEMORY", "cache_size=-32000"):
+        conn.execute(f"PRAGMA {pragma}")
     return conn
 
 def seed_users(conn):
@@ -19,32 +22,26 @@ def seed_users(conn):
         ("Jane Smith", "jane", "password123"), 
         ("Alice Johnson", "alice", "password123"),
     ]
-    
-    for name, username, password in users:
-        # Check if user already exists
-        existing = conn.execute("SELECT id, password FROM user WHERE username = ?", (username,)).fetchone()
-        hashed_password = generate_password_hash(password, method="pbkdf2:sha256")
-        if not existing:
-            # Create user with a PBKDF2 hash for maximum compatibility
-            conn.execute(
-                "INSERT INTO user (name, username, password) VALUES (?, ?, ?)",
-                (name, username, hashed_password)
-            )
-            print(f"Inserted user: {username}")
-        else:
-            # If an existing demo user has an unsupported hash (e.g., scrypt), update to PBKDF2
-            pwd = existing["password"] if isinstance(existing, sqlite3.Row) else existing[1]
-            if isinstance(pwd, (bytes, bytearray)):
-                pwd = pwd.decode("utf-8")
-            if isinstance(pwd, str) and pwd.startswith("scrypt:"):
-                conn.execute(
-                    "UPDATE user SET password = ? WHERE id = ?",
-                    (hashed_password, existing["id"] if isinstance(existing, sqlite3.Row) else existing[0])
-                )
-                print(f"Updated password hash to PBKDF2 for user: {username}")
-    
+    # PBKDF2 hashes for maximum compatibility. Each distinct demo password is
+    # hashed once; SEED_FAST=1 lowers the iteration count for throwaway DBs.
+    method = "pbkdf2:sha256:1000" if os.environ.get("SEED_FAST") == "1" else "pbkdf2:sha256"
+    hashes = {password: generate_password_hash(password, method=method) for password in {p for _, _, p in users}}
+    rows = [(name, username, hashes[password]) for name, username, password in users]
+
+    conn.execute("BEGIN IMMEDIATE")
+    # username is UNIQUE, so existing users are skipped without a pre-select
+    before = conn.total_changes
+    conn.executemany("INSERT OR IGNORE INTO user (name, username, password) VALUES (?, ?, ?)", rows)
+    inserted = conn.total_changes - before
+    # If an existing demo user has an unsupported hash (e.g., scrypt), update to PBKDF2
+    before = conn.total_changes
+    conn.executemany(
+        "UPDATE user SET password = ? WHERE username = ? AND password LIKE 'scrypt:%'",
+        [(hashed, username) for _, username, hashed in rows]
+    )
+    updated = conn.total_changes - before
     conn.commit()
-    print(f"Seeded users with authentication")
+    print(f"Seeded users with authentication (inserted {inserted}, rehashed {updated})")
 
 def seed_products(conn):
     """Insert demo products (price in cents)"""
@@ -55,16 +52,13 @@ def seed_products(conn):
         ("Keyboard", 7999, 15),
         ("Monitor", 24999, 8),
     ]
-    
-    for name, price, stock in products:
-        cursor = conn.execute(
-            "INSERT OR IGNORE INTO product (name, price_cents, stock) VALUES (?, ?, ?)",
-            (name, price, stock)
-        )
-        print(f"Inserted {name} - rowcount: {cursor.rowcount}")
-    
+
+    conn.execute("BEGIN IMMEDIATE")
+    before = conn.total_changes
+    conn.executemany("INSERT OR IGNORE INTO product (name, price_cents, stock) VALUES (?, ?, ?)", products)
+    inserted = conn.total_changes - before
     conn.commit()
-    print("Products seeded successfully!")
+    print(f"Products seeded successfully! (inserted {inserted})")
 
 def seed_partner_keys(conn):
     """Seed a default partner API key for local testing"""
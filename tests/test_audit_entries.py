@@ -42,3 +42,97 @@ def test_verify_api_key_returns_none_for_missing(tmp_path):
     # no keys inserted
     res = verify_api_key(db, "nope")
     assert res is None
+
+
+def test_deferred_audits_coalesce_into_one_flush(tmp_path):
+    import threading
+    from src.partners import security
+    from src.partners.db import IngestConnectionPool
+
+    db = get_test_db_path(tmp_path)
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE partner_ingest_audit (id INTEGER PRIMARY KEY AUTOINCREMENT, partner_id INTEGER, api_key TEXT, action TEXT, payload TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    conn.commit()
+    conn.close()
+
+    pool = IngestConnectionPool(db)
+    release = threading.Event()
+    submitted = []
+    real_submit = pool.submit_write_fn
+    pool.submit_write_fn = lambda fn: submitted.append(fn) or real_submit(fn)
+    try:
+        # hold the writer thread so the audits pile up behind it
+        real_submit(lambda c: release.wait(5))
+        for i in range(3):
+            security.record_audit_deferred(pool, i, "k", "burst")
+        release.set()
+        real_submit(lambda c: None).result(5)
+        assert len(submitted) == 1
+        with pool.reader() as rconn:
+            rows = rconn.execute("SELECT partner_id FROM partner_ingest_audit WHERE action = 'burst' ORDER BY id").fetchall()
+        assert [r[0] for r in rows] == [0, 1, 2]
+    finally:
+        pool.close()
+
+
+def test_verify_api_key_matches_full_key_within_prefix(tmp_path):
+    db = get_test_db_path(tmp_path)
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE partner_api_keys (id INTEGER PRIMARY KEY AUTOINCREMENT, partner_id INTEGER, api_key TEXT)")
+    conn.executemany("INSERT INTO partner_api_keys (partner_id, api_key) VALUES (?, ?)", [(1, "abcd-one"), (2, "abcd-two")])
+    conn.commit()
+    conn.close()
+    assert verify_api_key(db, "abcd-two") == 2
+    assert verify_api_key(db, "abcd-on") is None
+
+
+def test_deferred_audits_drop_oldest_past_cap(tmp_path, monkeypatch):
+    import threading
+    from src.partners import security
+    from src.partners.db import IngestConnectionPool
+
+    monkeypatch.setattr(security, "AUDIT_PENDING_MAX", 2)
+    db = get_test_db_path(tmp_path)
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE partner_ingest_audit (id INTEGER PRIMARY KEY AUTOINCREMENT, partner_id INTEGER, api_key TEXT, action TEXT, payload TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    conn.commit()
+    conn.close()
+
+    pool = IngestConnectionPool(db)
+    release = threading.Event()
+    try:
+        pool.submit_write_fn(lambda c: release.wait(5))
+        for i in range(4):
+            security.record_audit_deferred(pool, i, "k", "burst")
+        release.set()
+        pool.execute_write_fn(lambda c: None)
+        with pool.reader() as rconn:
+            rows = rconn.execute("SELECT partner_id FROM partner_ingest_audit ORDER BY id").fetchall()
+        assert [r[0] for r in rows] == [2, 3]
+    finally:
+        pool.close()
+
+
+def test_pool_close_runs_audit_flush_queued_behind_stop(tmp_path):
+    import threading
+    from src.partners import security
+    from src.partners.db import IngestConnectionPool
+
+    db = get_test_db_path(tmp_path)
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE partner_ingest_audit (id INTEGER PRIMARY KEY AUTOINCREMENT, partner_id INTEGER, api_key TEXT, action TEXT, payload TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    conn.commit()
+    conn.close()
+
+    pool = IngestConnectionPool(db)
+    release = threading.Event()
+    pool.submit_write_fn(lambda c: release.wait(5))
+    # the writer thread stops before reaching the flush queued after this
+    pool._write_queue.put(None)
+    security.record_audit_deferred(pool, 1, "k", "late")
+    release.set()
+    pool.close()
+    assert pool not in security._audit_pending
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT action FROM partner_ingest_audit").fetchall() == [("late",)]
+    conn.close()
@@ -2,14 +2,15 @@ import os
 import json
 import sqlite3
 import importlib
-from pathlib import Path
+
+from src.partners.testing import create_test_db
 
 
 def setup_db(tmp_path):
     dbfile = tmp_path / "test_app.sqlite"
-    sql = Path("db/init.sql").read_text()
+    # schema copied from a per-session template (already in WAL mode)
+    create_test_db(str(dbfile))
     conn = sqlite3.connect(str(dbfile))
-    conn.executescript(sql)
     cur = conn.cursor()
     cur.execute("INSERT INTO partner (name, format, endpoint) VALUES (?, ?, ?)", ("TestPartner", "json", "/"))
     pid = cur.lastrowid
@@ -23,7 +24,7 @@ def test_sync_ingest(tmp_path):
     db_path, pid = setup_db(tmp_path)
     os.environ["APP_DB_PATH"] = db_path
 
-    # import app after env is set so get_conn picks up the test DB
+    # import app after env is set so the pool picks up the test DB
     import src.partners.routes as routes
     importlib.reload(routes)
     app = routes.app
@@ -70,3 +71,358 @@ def test_async_ingest_enqueue_called(tmp_path, monkeypatch):
     assert called[0][0] == pid
     # product payload should be passed through (or similar dict); ensure name present
     assert any(p.get("name") == "AsyncTest" for p in called[0][1])
+
+
+def test_ingest_rate_limited_returns_retry_after(tmp_path, monkeypatch):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    import src.partners.routes as routes
+    importlib.reload(routes)
+    monkeypatch.setattr(routes, "take_rate_token", lambda api_key, max_per_minute=60, scope="ingest": 2.4)
+
+    client = routes.app.test_client()
+    resp = client.post("/partner/ingest?async=0", data="[]", content_type="application/json", headers={"X-API-Key": "test-key"})
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "3"
+    body = resp.get_json()
+    assert body["ok"] is False and body["code"] == "partner.rate_limited"
+
+
+def test_sync_ingest_file_upload_records_feed_hash(tmp_path):
+    import hashlib
+    import io
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    body = b"sku,name,price_cents,stock\nup-1,Uploaded,120,3\n"
+    client = routes.app.test_client()
+    resp = client.post(
+        "/partner/ingest?async=0",
+        data={"file": (io.BytesIO(body), "feed.csv")},
+        content_type="multipart/form-data",
+        headers={"X-API-Key": "test-key"},
+    )
+    assert resp.status_code == 200
+    assert resp.get_json()["accepted"] == 1
+
+    conn = sqlite3.connect(db_path)
+    row = conn.execute("SELECT feed_hash FROM partner_feed_imports WHERE partner_id = ?", (pid,)).fetchone()
+    conn.close()
+    assert row == ("b2:" + hashlib.blake2b(body, digest_size=32).hexdigest(),)
+
+
+def test_sync_ingest_skips_feed_recorded_under_legacy_sha256(tmp_path):
+    import hashlib
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    body = json.dumps([{"sku": "old-1", "name": "Legacy", "price_cents": 100, "stock": 1}]).encode()
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO partner_feed_imports (partner_id, feed_hash) VALUES (?, ?)", (pid, hashlib.sha256(body).hexdigest()))
+    conn.commit()
+    conn.close()
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    resp = routes.app.test_client().post("/partner/ingest?async=0", data=body, content_type="application/json", headers={"X-API-Key": "test-key"})
+    assert resp.status_code == 200
+    assert resp.get_json()["accepted"] == 0 and resp.get_json()["errors"] == ["Feed already processed"]
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM product WHERE name = 'Legacy'").fetchone()[0] == 0
+    conn.close()
+
+
+def test_sync_ingest_hashes_once_without_legacy_imports(tmp_path, monkeypatch):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO partner_feed_imports (partner_id, feed_hash) VALUES (?, 'b2:00')", (pid,))
+    conn.commit()
+    conn.close()
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    def no_legacy_pass(buf):
+        raise AssertionError("legacy sha256 computed")
+
+    monkeypatch.setattr(routes, "_legacy_feed_hash", no_legacy_pass)
+    body = json.dumps([{"sku": "new-1", "name": "Fresh", "price_cents": 100, "stock": 1}]).encode()
+    client = routes.app.test_client()
+    resp = client.post("/partner/ingest?async=0", data=body, content_type="application/json", headers={"X-API-Key": "test-key"})
+    assert resp.status_code == 200 and resp.get_json()["accepted"] == 1
+    resp = client.post("/partner/contract/validate", data=body, content_type="application/json", headers={"X-API-Key": "test-key"})
+    assert resp.status_code == 200
+
+
+def test_resolve_partner_id_caches_and_invalidates(tmp_path):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    assert routes.resolve_partner_id("test-key") == pid
+    assert routes.resolve_partner_id("new-key") is None
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO partner_api_keys (partner_id, api_key) VALUES (?, ?)", (pid, "new-key"))
+    conn.execute("DELETE FROM partner_api_keys WHERE api_key = 'test-key'")
+    conn.commit()
+    conn.close()
+    # both answers are served from the cache until it is invalidated
+    assert routes.resolve_partner_id("test-key") == pid
+    assert routes.resolve_partner_id("new-key") is None
+    routes.invalidate_key_cache()
+    assert routes.resolve_partner_id("test-key") is None
+    assert routes.resolve_partner_id("new-key") == pid
+
+
+def test_key_cache_is_bounded(tmp_path, monkeypatch):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    import src.partners.routes as routes
+    importlib.reload(routes)
+    monkeypatch.setattr(routes, "KEY_CACHE_MAX", 3)
+
+    for i in range(5):
+        assert routes.resolve_partner_id(f"bogus-{i}") is None
+    assert [k for _, k in routes._KEY_CACHE] == ["bogus-2", "bogus-3", "bogus-4"]
+
+
+def test_malformed_keys_skip_lookup_and_cache(tmp_path):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    for key in ("", "kéy", "x" * 1000):
+        assert routes.resolve_partner_id(key) is None
+    assert routes._KEY_CACHE == {}
+
+
+def test_partner_jobs_counts_by_status(tmp_path, monkeypatch):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    monkeypatch.setenv("ADMIN_API_KEY", "admin-test")
+    conn = sqlite3.connect(db_path)
+    for status in ("pending", "pending", "failed"):
+        conn.execute("INSERT INTO partner_ingest_jobs (partner_id, payload, status) VALUES (?, '[]', ?)", (pid, status))
+    conn.commit()
+    conn.close()
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    client = routes.app.test_client()
+    headers = {"X-Admin-Key": "admin-test"}
+    resp = client.get("/partner/jobs", headers=headers)
+    assert resp.status_code == 200
+    assert resp.get_json()["counts"] == {"pending": 2, "in_progress": 0, "done": 0, "failed": 1}
+
+    # unchanged polls revalidate to 304; a status change yields a new body
+    etag = resp.headers["ETag"]
+    assert client.get("/partner/jobs", headers={**headers, "If-None-Match": etag}).status_code == 304
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE partner_ingest_jobs SET status = 'done' WHERE status = 'failed'")
+    conn.commit()
+    conn.close()
+    resp = client.get("/partner/jobs", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 200 and resp.get_json()["counts"]["done"] == 1
+
+
+def test_async_ingest_inserts_one_job_and_defers_audit(tmp_path, monkeypatch):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    import src.partners.routes as routes
+    importlib.reload(routes)
+    monkeypatch.setattr(routes, "start_worker", lambda db_path: None)
+
+    client = routes.app.test_client()
+    payload = [{"sku": "sku-async-1", "name": "AsyncOne", "price_cents": 100, "stock": 1}]
+    resp = client.post("/partner/ingest?async=1", data=json.dumps(payload), content_type="application/json", headers={"X-API-Key": "test-key"})
+    assert resp.status_code == 202
+    jid = resp.get_json()["job_id"]
+
+    # writes run in submission order, so a no-op flushes the queued audit row
+    routes.get_pool(db_path).execute_write_fn(lambda conn: None)
+    conn = sqlite3.connect(db_path)
+    jobs = conn.execute("SELECT id, partner_id FROM partner_ingest_jobs").fetchall()
+    audit = conn.execute("SELECT action FROM partner_ingest_audit WHERE action = 'enqueue'").fetchall()
+    conn.close()
+    assert jobs == [(jid, pid)]
+    assert audit == [("enqueue",)]
+
+
+def test_admin_audit_filters_by_prefix_and_pages_by_id(tmp_path):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    conn = sqlite3.connect(db_path)
+    for key in ("abc-1", "abc-2", "abd-3", "abc-4"):
+        conn.execute("INSERT INTO partner_ingest_audit (partner_id, api_key, action) VALUES (?, ?, 'enqueue')", (pid, key))
+    conn.commit()
+    conn.close()
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    client = routes.app.test_client()
+    resp = client.get("/partner/admin/audit?action=enqueue&api_key_prefix=abc&limit=2")
+    html = resp.get_data(as_text=True)
+    assert resp.status_code == 200
+    assert "abc-4" in html and "abc-2" in html and "abc-1" not in html and "abd-3" not in html
+    assert "before_id=2" in html
+
+    html = client.get("/partner/admin/audit?action=enqueue&api_key_prefix=abc&limit=2&before_id=2").get_data(as_text=True)
+    assert "abc-1" in html and "abc-2" not in html
+
+
+def test_admin_audit_prefix_filter_ignores_case(tmp_path):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    conn = sqlite3.connect(db_path)
+    for key in ("ABC-1", "abc-2", "abd-3"):
+        conn.execute("INSERT INTO partner_ingest_audit (partner_id, api_key, action) VALUES (?, ?, 'enqueue')", (pid, key))
+    conn.commit()
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    html = routes.app.test_client().get("/partner/admin/audit?action=enqueue&api_key_prefix=aBc").get_data(as_text=True)
+    assert "ABC-1" in html and "abc-2" in html and "abd-3" not in html
+    plan = conn.execute("EXPLAIN QUERY PLAN " + routes._audit_query(True, True, False), ("enqueue", "abc", "abc\U0010ffff", 10)).fetchall()
+    conn.close()
+    assert any("ix_audit_action_apikey_ci_id" in row[-1] for row in plan)
+
+
+def test_partner_routing_errors_use_json_envelope(tmp_path):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    client = routes.app.test_client()
+    resp = client.get("/partner/ingest")
+    assert resp.status_code == 405
+    assert resp.get_json()["code"] == "partner.method_not_allowed"
+    resp = client.get("/partner/does-not-exist")
+    assert resp.status_code == 404 and resp.get_json()["ok"] is False
+    # paths outside the blueprint keep Flask's default error page
+    assert client.get("/nowhere").mimetype == "text/html"
+
+
+def test_admin_key_must_match_configured_key(tmp_path, monkeypatch):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    monkeypatch.setenv("ADMIN_API_KEY", "admin-test")
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    client = routes.app.test_client()
+    assert client.get("/partner/jobs", headers={"X-Admin-Key": "wrong"}).status_code == 401
+    assert client.get("/partner/jobs").status_code == 401
+    assert client.get("/partner/jobs", headers={"X-Admin-Key": "admin-test"}).status_code == 200
+
+
+def test_onboard_json_and_form_share_one_handler(tmp_path, monkeypatch):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    monkeypatch.setenv("ADMIN_API_KEY", "admin-test")
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    client = routes.app.test_client()
+    headers = {"X-Admin-Key": "admin-test"}
+    r1 = client.post("/partner/onboard", json={"name": "JsonCo"}, headers=headers)
+    r2 = client.post("/partner/onboard_form", data={"name": "FormCo", "format": "csv"}, headers=headers)
+    assert r1.status_code == 200 and r2.status_code == 200
+    assert routes.resolve_partner_id(r2.get_json()["api_key"]) == r2.get_json()["partner_id"]
+    assert client.post("/partner/onboard_form", data={}, headers=headers).status_code == 400
+    assert client.post("/partner/onboard", json={"name": "NoKey"}).status_code == 401
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT name, format FROM partner WHERE id = ?", (r2.get_json()["partner_id"],)).fetchone() == ("FormCo", "csv")
+    conn.close()
+
+
+def test_onboarded_key_authenticates_with_hash_keys_on(tmp_path, monkeypatch):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    monkeypatch.setenv("ADMIN_API_KEY", "admin-test")
+    monkeypatch.setenv("HASH_KEYS", "on")
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    client = routes.app.test_client()
+    r = client.post("/partner/onboard", json={"name": "HashCo"}, headers={"X-Admin-Key": "admin-test"})
+    assert r.status_code == 200
+    api_key = r.get_json()["api_key"]
+    conn = sqlite3.connect(db_path)
+    stored = conn.execute("SELECT api_key FROM partner_api_keys WHERE partner_id = ?", (r.get_json()["partner_id"],)).fetchone()[0]
+    conn.close()
+    assert stored != api_key
+    resp = client.post("/partner/ingest?async=0", data="[]", content_type="application/json", headers={"X-API-Key": api_key})
+    assert resp.status_code != 401
+
+
+def test_requeue_job_enforces_ownership_in_one_write(tmp_path):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    conn = sqlite3.connect(db_path)
+    other = conn.execute("INSERT INTO partner (name, format) VALUES ('Other', 'json')").lastrowid
+    mine = conn.execute("INSERT INTO partner_ingest_jobs (partner_id, payload, status, attempts) VALUES (?, '[]', 'failed', 3)", (pid,)).lastrowid
+    theirs = conn.execute("INSERT INTO partner_ingest_jobs (partner_id, payload, status) VALUES (?, '[]', 'failed')", (other,)).lastrowid
+    conn.commit()
+    conn.close()
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    client = routes.app.test_client()
+    headers = {"X-API-Key": "test-key"}
+    assert client.post(f"/partner/jobs/{mine}/requeue", headers=headers).status_code == 200
+    assert client.post(f"/partner/jobs/{theirs}/requeue", headers=headers).status_code == 403
+    assert client.post("/partner/jobs/9999/requeue", headers=headers).status_code == 404
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT id, status, attempts FROM partner_ingest_jobs ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [(mine, "pending", 0), (theirs, "failed", 0)]
+
+
+def test_async_ingest_reuses_pending_job_for_same_feed(tmp_path, monkeypatch):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    import src.partners.routes as routes
+    importlib.reload(routes)
+    monkeypatch.setattr(routes, "start_worker", lambda db_path: None)
+
+    client = routes.app.test_client()
+    body = json.dumps([{"sku": "sku-dup", "name": "Dup", "price_cents": 5, "stock": 1}])
+    headers = {"X-API-Key": "test-key"}
+    first = client.post("/partner/ingest?async=1", data=body, content_type="application/json", headers=headers)
+    second = client.post("/partner/ingest?async=1", data=body, content_type="application/json", headers=headers)
+    assert first.status_code == second.status_code == 202
+    assert second.get_json() == {"job_id": first.get_json()["job_id"], "status": "accepted", "duplicate": True}
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM partner_ingest_jobs").fetchone()[0] == 1
+    conn.close()
+
+
+def test_job_status_and_diagnostics_hold_one_reader(tmp_path):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+    conn = sqlite3.connect(db_path)
+    jid = conn.execute("INSERT INTO partner_ingest_jobs (partner_id, payload, status) VALUES (?, '[]', 'failed')", (pid,)).lastrowid
+    did = conn.execute("INSERT INTO partner_ingest_diagnostics (job_id, diagnostics) VALUES (?, '{}')", (jid,)).lastrowid
+    conn.commit()
+    conn.close()
+    import src.partners.routes as routes
+    from src.partners.db import get_pool
+    importlib.reload(routes)
+    # a single reader: a nested key lookup would time out waiting for it
+    pool = get_pool(db_path)
+    pool.max_readers, pool.timeout = 1, 0.2
+
+    client = routes.app.test_client()
+    headers = {"X-API-Key": "test-key"}
+    assert client.get(f"/partner/jobs/{jid}", headers=headers).status_code == 200
+    routes.invalidate_key_cache()
+    assert client.get(f"/partner/diagnostics/{did}", headers=headers).status_code == 200
+    routes.invalidate_key_cache()
+    assert client.get(f"/partner/jobs/{jid}", headers={"X-API-Key": "bogus"}).status_code == 401
@@ -0,0 +1,38 @@
+import datetime
+
+import pytest
+from flask import Flask, jsonify
+
+from src.partners import json_provider
+from src.partners.json_provider import OrjsonProvider, orjson
+from src.partners.partner_adapters import parse_json_feed
+
+
+@pytest.mark.skipif(orjson is None, reason="orjson not installed")
+def test_orjson_provider_matches_default_output():
+    app = Flask(__name__)
+    app.json = OrjsonProvider(app)
+    day = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    with app.app_context():
+        resp = jsonify({"b": 1, "a": day, "big": 2 ** 70})
+        assert resp.get_json() == {"a": "Tue, 02 Jan 2024 03:04:05 GMT", "b": 1, "big": 2 ** 70}
+        assert app.json.loads(b'{"x": [1, 2]}') == {"x": [1, 2]}
+        assert app.json.dumps({"z": 1, "y": 2}) == '{"y":2,"z":1}'
+
+
+@pytest.mark.skipif(orjson is None, reason="orjson not installed")
+def test_orjson_provider_loads_integers_wider_than_64_bits(monkeypatch):
+    app = Flask(__name__)
+    app.json = OrjsonProvider(app)
+    body = b'{"big": 1180591620717411303425, "neg": -9223372036854775809}'
+    expected = {"big": 2 ** 70 + 1, "neg": -(2 ** 63) - 1}
+    assert app.json.loads(body) == expected
+
+    # orjson releases that reject wide integers instead of rounding them
+    def strict_loads(data):
+        raise orjson.JSONDecodeError("Integer exceeds 64-bit range", "", 0)
+
+    monkeypatch.setattr(json_provider, "_WIDE_INTS_AS_FLOAT", False)
+    monkeypatch.setattr(orjson, "loads", strict_loads)
+    assert app.json.loads(body) == expected
+    assert parse_json_feed(b'[{"name": "Big", "price_cents": 1180591620717411303425}]')[0]["price_cents"] == 2 ** 70 + 1
@@ -1,3 +1,6 @@
+import io
+import tempfile
+
 import pytest
 from src.partners.partner_adapters import parse_json_feed, parse_csv_feed
 
@@ -17,3 +20,35 @@ def test_parse_csv_feed():
     assert out[0]["sku"] == "s2"
     assert out[0]["name"] == "Item B"
     assert out[0]["price_cents"] == 250
+
+
+@pytest.mark.parametrize("rolled_over", [False, True])
+def test_parse_csv_feed_from_spooled_upload(rolled_over):
+    with tempfile.SpooledTemporaryFile(max_size=1024) as spool:
+        spool.write(b"sku,name,price,stock\ns3,Item C,1.5,1\n")
+        if rolled_over:
+            spool.rollover()
+        spool.seek(0)
+        out = parse_csv_feed(spool)
+        # the spool is left open for the caller
+        assert not spool.closed
+    assert out[0]["sku"] == "s3" and out[0]["price_cents"] == 150
+
+
+def test_parse_csv_feed_from_non_io_file_object():
+    # e.g. SpooledTemporaryFile before Python 3.11, which lacks readable()
+    class PlainReader:
+        def __init__(self, data):
+            self._buf = io.BytesIO(data)
+
+        def read(self, size=-1):
+            return self._buf.read(size)
+
+        def seek(self, pos, whence=0):
+            return self._buf.seek(pos, whence)
+
+        def tell(self):
+            return self._buf.tell()
+
+    out = parse_csv_feed(PlainReader(b"sku,name,price,stock\ns4,Item D,2.5,1\n"))
+    assert out[0]["sku"] == "s4" and out[0]["price_cents"] == 250
@@ -0,0 +1,98 @@
+import importlib
+import sqlite3
+
+import pytest
+
+from src.partners.db import IngestConnectionPool
+from src.partners.testing import create_test_db
+
+
+def make_pool(tmp_path, **kwargs):
+    db_path = tmp_path / "pool.sqlite"
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("CREATE TABLE t (v INTEGER)")
+    conn.commit()
+    conn.close()
+    return IngestConnectionPool(str(db_path), **kwargs)
+
+
+def test_writer_uses_wal_and_readers_see_commits(tmp_path):
+    pool = make_pool(tmp_path)
+    try:
+        with pool.writer() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            conn.execute("INSERT INTO t (v) VALUES (1)")
+        with pool.reader() as conn:
+            assert [tuple(r) for r in conn.execute("SELECT v FROM t")] == [(1,)]
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("INSERT INTO t (v) VALUES (2)")
+    finally:
+        pool.close()
+
+
+def test_readers_are_reused_and_bounded(tmp_path):
+    pool = make_pool(tmp_path, timeout=0.1, max_readers=1)
+    try:
+        with pool.reader() as first:
+            with pytest.raises(sqlite3.OperationalError):
+                with pool.reader():
+                    pass
+        with pool.reader() as again:
+            assert again is first
+    finally:
+        pool.close()
+
+
+def test_execute_write_runs_on_writer_thread(tmp_path):
+    pool = make_pool(tmp_path)
+    try:
+        cur = pool.execute_write("INSERT INTO t (v) VALUES (?)", (7,))
+        assert cur.rowcount == 1
+
+        def insert_then_fail(conn):
+            conn.execute("INSERT INTO t (v) VALUES (8)")
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            pool.execute_write_fn(insert_then_fail)
+        assert pool.execute_write_fn(lambda conn: conn.execute("SELECT v FROM t").fetchall()) == [(7,)]
+    finally:
+        pool.close()
+
+
+def test_reader_rows_are_mappings(tmp_path):
+    pool = make_pool(tmp_path)
+    try:
+        pool.execute_write("INSERT INTO t (v) VALUES (5)")
+        with pool.reader() as conn:
+            row = conn.execute("SELECT v FROM t").fetchone()
+        assert row[0] == 5 and dict(row) == {"v": 5}
+    finally:
+        pool.close()
+
+
+def test_routes_get_read_and_get_write_borrow_pooled_connections(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "routes.sqlite")
+    create_test_db(db_path)
+    monkeypatch.setenv("APP_DB_PATH", db_path)
+    import src.partners.routes as routes
+    importlib.reload(routes)
+
+    with routes.get_write() as conn:
+        conn.execute("INSERT INTO partner (name, format) VALUES ('Pooled', 'json')")
+    with routes.get_read() as rconn:
+        assert rconn.execute("SELECT COUNT(*) FROM partner WHERE name = 'Pooled'").fetchone()[0] == 1
+    with routes.get_write() as again:
+        assert again is conn
+
+
+def test_pooled_connections_apply_pragmas(tmp_path):
+    pool = make_pool(tmp_path)
+    try:
+        with pool.writer() as conn:
+            assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+        with pool.reader() as conn:
+            assert conn.execute("PRAGMA cache_size").fetchone()[0] == -32000
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    finally:
+        pool.close()
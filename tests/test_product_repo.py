@@ -25,10 +25,8 @@ def create_test_schema(conn):
     ''')
     
     # Insert test data
-    conn.execute("INSERT INTO product (name, price_cents, stock, active) VALUES (?, ?, ?, ?)", 
-                 ("Test Product", 1999, 10, 1))
-    conn.execute("INSERT INTO product (name, price_cents, stock, active) VALUES (?, ?, ?, ?)", 
-                 ("Inactive Product", 999, 5, 0))
+    conn.executemany("INSERT INTO product (name, price_cents, stock, active) VALUES (?, ?, ?, ?)",
+                     [("Test Product", 1999, 10, 1), ("Inactive Product", 999, 5, 0)])
     conn.commit()
 
 def test_product_database_schema():
@@ -1,3 +1,5 @@
+import pytest
+
 from src.partners import security
 
 
@@ -13,3 +15,35 @@ def test_rate_limiter_allows_until_limit():
         assert security.check_rate_limit(api_key, max_per_minute=3) is True
     # next call should be rejected
     assert security.check_rate_limit(api_key, max_per_minute=3) is False
+
+
+def test_rate_limiter_reports_wait_and_refills(monkeypatch):
+    api_key = "rl-bucket-key"
+    now = [1000.0]
+    monkeypatch.setattr(security.time, "monotonic", lambda: now[0])
+    assert security.take_rate_token(api_key, max_per_minute=60) == 0.0
+    for _ in range(59):
+        security.take_rate_token(api_key, max_per_minute=60)
+    assert security.take_rate_token(api_key, max_per_minute=60) == pytest.approx(1.0)
+    now[0] += 1.0
+    assert security.take_rate_token(api_key, max_per_minute=60) == 0.0
+
+
+def test_rate_limiter_sweeps_idle_buckets(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(security.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(security, "_sweep_at", 3)
+    for key in ("a", "b", "c"):
+        security.take_rate_token(key)
+    now[0] = 61.0
+    security.take_rate_token("d")
+    assert set(security._limits) == {("ingest", "d")}
+
+
+def test_rate_limiter_buckets_are_per_scope():
+    api_key = "rl-scope-key"
+    for _ in range(3):
+        assert security.check_rate_limit(api_key, max_per_minute=3, scope="contract_validate")
+    assert not security.check_rate_limit(api_key, max_per_minute=3, scope="contract_validate")
+    # the ingest bucket for the same key is untouched
+    assert security.check_rate_limit(api_key, max_per_minute=3)
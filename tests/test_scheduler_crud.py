@@ -2,14 +2,15 @@ import os
 import json
 import sqlite3
 import importlib
-from pathlib import Path
+
+from src.partners.testing import create_test_db
 
 
 def setup_db(tmp_path):
     dbfile = tmp_path / "test_app.sqlite"
-    sql = Path("db/init.sql").read_text()
+    # schema copied from a per-session template (already in WAL mode)
+    create_test_db(str(dbfile))
     conn = sqlite3.connect(str(dbfile))
-    conn.executescript(sql)
     cur = conn.cursor()
     cur.execute("INSERT INTO partner (name, format, endpoint) VALUES (?, ?, ?)", ("SchedPartner", "json", "/"))
     pid = cur.lastrowid
@@ -44,3 +45,31 @@ def test_schedule_crud(tmp_path):
     sid = data[0]['id']
     r = client.delete(f'/partner/schedules/{sid}', headers={"X-Admin-Key": "admin-demo-key"})
     assert r.status_code == 200
+
+    # every admin schedule operation leaves an audit row with a masked key
+    routes.get_pool(db_path).execute_write_fn(lambda conn: None)  # drain deferred audit writes
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT action, api_key FROM partner_ingest_audit WHERE action LIKE 'admin_%schedule%' ORDER BY id").fetchall()
+    conn.close()
+    assert [a for a, _ in rows] == ["admin_create_schedule", "admin_list_schedules", "admin_delete_schedule"]
+    assert all(k != "admin-demo-key" for _, k in rows)
+
+
+def test_schedule_bulk_create_is_all_or_nothing(tmp_path):
+    db_path, pid = setup_db(tmp_path)
+    os.environ["APP_DB_PATH"] = db_path
+
+    import src.partners.routes as routes
+    importlib.reload(routes)
+    client = routes.app.test_client()
+    headers = {"X-Admin-Key": "admin-demo-key"}
+
+    bulk = [
+        {"partner_id": pid, "schedule_type": "interval", "schedule_value": {"seconds": 30}},
+        {"partner_id": pid, "schedule_type": "cron", "schedule_value": "0 * * * *", "enabled": False},
+    ]
+    assert client.post('/partner/schedules', json=bulk, headers=headers).status_code == 201
+    assert client.post('/partner/schedules', json=bulk + [{"partner_id": pid}], headers=headers).status_code == 400
+
+    rows = client.get('/partner/schedules', headers=headers).get_json()
+    assert sorted((r['schedule_type'], r['enabled']) for r in rows) == [("cron", 0), ("interval", 1)]
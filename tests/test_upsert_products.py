@@ -0,0 +1,188 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from src.partners.db import IngestConnectionPool
+from src.partners import partner_ingest_service as ingest_service
+from src.partners.partner_ingest_service import _STMT_CACHE, upsert_products
+from src.partners.testing import create_test_db
+
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def make_db(tmp_path, with_sku=False):
+    create_test_db(str(tmp_path / "upsert.sqlite"))
+    conn = sqlite3.connect(str(tmp_path / "upsert.sqlite"))
+    if with_sku:
+        conn.executescript((ROOT / "migrations" / "0002_add_product_sku.sql").read_text())
+    conn.execute("INSERT INTO product (name, price_cents, stock) VALUES ('Laptop', 100, 1)")
+    conn.commit()
+    return conn
+
+
+def test_upsert_updates_by_normalized_name(tmp_path):
+    conn = make_db(tmp_path)
+    items = [
+        {"sku": "", "name": "laptop", "price_cents": 250, "stock": 4},
+        {"sku": "", "name": "Mouse", "price_cents": 50, "stock": 9},
+    ]
+    upserted, errors = upsert_products(conn, items)
+    assert (upserted, errors) == (2, [])
+    rows = conn.execute("SELECT name, price_cents, stock FROM product ORDER BY id").fetchall()
+    assert rows == [("Laptop", 250, 4), ("Mouse", 50, 9)]
+
+
+def test_upsert_matches_sku_before_name(tmp_path):
+    conn = make_db(tmp_path, with_sku=True)
+    upsert_products(conn, [{"sku": "sku-1", "name": "Keyboard", "price_cents": 10, "stock": 1}])
+    upserted, errors = upsert_products(conn, [{"sku": "sku-1", "name": "Keyboard v2", "price_cents": 20, "stock": 2}])
+    assert (upserted, errors) == (1, [])
+    rows = conn.execute("SELECT name, price_cents, stock, sku FROM product WHERE sku = 'sku-1'").fetchall()
+    assert rows == [("Keyboard", 20, 2, "sku-1")]
+
+
+def test_upsert_reports_per_item_errors(tmp_path):
+    conn = make_db(tmp_path)
+    items = [
+        {"sku": "", "name": "Cable", "price_cents": 5, "stock": 1},
+        {"sku": "", "name": "Broken", "price_cents": -1, "stock": 1},
+    ]
+    upserted, errors = upsert_products(conn, items)
+    assert upserted == 1
+    assert len(errors) == 1 and errors[0].startswith("Item 1")
+
+
+def test_upsert_through_connection_pool(tmp_path):
+    conn = make_db(tmp_path)
+    conn.close()
+    pool = IngestConnectionPool(str(tmp_path / "upsert.sqlite"))
+    try:
+        items = [{"sku": "", "name": "Monitor", "price_cents": 900, "stock": 3}]
+        assert upsert_products(pool, items, partner_id=1, feed_hash="h1") == (1, [])
+        assert upsert_products(pool, items, partner_id=1, feed_hash="h1") == (0, ["Feed already processed"])
+        with pool.reader() as rconn:
+            row = rconn.execute("SELECT price_cents, stock FROM product WHERE name = 'Monitor'").fetchone()
+        assert tuple(row) == (900, 3)
+    finally:
+        pool.close()
+
+
+def test_upsert_merges_repeated_new_products_in_batch(tmp_path, monkeypatch):
+    # several IN (...) chunks per lookup
+    monkeypatch.setattr(ingest_service, "_LOOKUP_CHUNK", 2)
+    conn = make_db(tmp_path, with_sku=True)
+    items = [
+        {"sku": "", "name": "Dock", "price_cents": 70, "stock": 2},
+        {"sku": "", "name": " dock ", "price_cents": 80, "stock": 5},
+        {"sku": "k-1", "name": "Key", "price_cents": 10, "stock": 1},
+        {"sku": "k-1", "name": "Key v2", "price_cents": 20, "stock": 2},
+        {"sku": "", "name": "LAPTOP", "price_cents": 300, "stock": 3},
+    ]
+    assert upsert_products(conn, items) == (5, [])
+    rows = conn.execute("SELECT name, price_cents, stock, sku FROM product ORDER BY id").fetchall()
+    assert rows == [("Laptop", 300, 3, None), ("Dock", 80, 5, None), ("Key", 20, 2, "k-1")]
+    assert any(sql is not None for sql, _, _ in _STMT_CACHE.values())
+
+
+def test_upsert_allows_names_differing_only_in_case(tmp_path):
+    conn = make_db(tmp_path)
+    conn.execute("INSERT INTO product (name, price_cents, stock) VALUES ('laptop ', 200, 2)")
+    conn.commit()
+    conn.executescript((ROOT / "migrations" / "0002_add_product_sku.sql").read_text())
+    assert upsert_products(conn, [{"sku": "", "name": "LAPTOP", "price_cents": 300, "stock": 3}]) == (1, [])
+    assert conn.execute("SELECT COUNT(*) FROM product").fetchone()[0] == 2
+    assert conn.execute("SELECT COUNT(*) FROM product WHERE price_cents = 300").fetchone()[0] == 1
+
+
+def test_upsert_converts_dollar_prices_in_sql(tmp_path):
+    conn = make_db(tmp_path)
+    items = [
+        {"sku": "", "name": "Laptop", "price": 19.99, "stock": 1},
+        {"sku": "", "name": "Stand", "price": "4.5", "stock": 1},
+        {"sku": "", "name": "Sticker", "price": None, "stock": 1},
+    ]
+    assert upsert_products(conn, items) == (3, [])
+    rows = conn.execute("SELECT name, price_cents FROM product ORDER BY id").fetchall()
+    assert rows == [("Laptop", 1999), ("Stand", 450), ("Sticker", 0)]
+
+
+def test_upsert_restores_row_factory(tmp_path):
+    conn = make_db(tmp_path)
+    conn.row_factory = sqlite3.Row
+    items = [{"sku": "", "name": "Pad", "price_cents": 1, "stock": 1}, {"sku": "", "name": "pad", "price_cents": 2, "stock": 1}]
+    assert upsert_products(conn, items) == (2, [])
+    assert conn.row_factory is sqlite3.Row
+    assert upsert_products(conn, [{"sku": "", "name": "laptop", "price_cents": 5, "stock": 1}]) == (1, [])
+    assert conn.row_factory is sqlite3.Row
+    assert conn.execute("SELECT price_cents FROM product WHERE name = 'Laptop'").fetchone()["price_cents"] == 5
+
+
+def test_upsert_bulk_mode_rebuilds_secondary_indexes(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_service, "BULK_INDEX_THRESHOLD", 2)
+    conn = make_db(tmp_path)
+    before = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'product' ORDER BY name").fetchall()
+    items = [{"sku": "", "name": f"Bulk {i}", "price_cents": i, "stock": 1} for i in range(3)]
+    assert upsert_products(conn, items, bulk_mode=True) == (3, [])
+    after = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'product' ORDER BY name").fetchall()
+    assert after == before
+    assert conn.execute("SELECT COUNT(*) FROM product WHERE active = 1").fetchone()[0] == 4
+
+
+def _product_indexes(conn):
+    return conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'product' ORDER BY name").fetchall()
+
+
+def test_upsert_bulk_mode_commit_false_and_error_rollback(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_service, "BULK_INDEX_THRESHOLD", 2)
+    conn = make_db(tmp_path)
+    conn.execute("CREATE INDEX ix_product_stock ON product(stock)")
+    conn.commit()
+    before = _product_indexes(conn)
+    items = [{"sku": "", "name": f"Bulk {i}", "price_cents": i, "stock": 1} for i in range(3)]
+    assert upsert_products(conn, items, bulk_mode=True, commit=False) == (3, [])
+    assert conn.in_transaction
+    conn.rollback()
+    assert _product_indexes(conn) == before
+    assert conn.execute("SELECT COUNT(*) FROM product").fetchone()[0] == 1
+
+    def boom(wconn, *args, **kwargs):
+        wconn.execute("INSERT INTO product (name, price_cents, stock) VALUES ('Partial', 1, 1)")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(ingest_service, "_upsert_batch", boom)
+    # the caller's own statement in the same transaction survives the failure
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("INSERT INTO partner (name, format) VALUES ('Caller', 'json')")
+    with pytest.raises(RuntimeError):
+        upsert_products(conn, items, bulk_mode=True, commit=False)
+    assert conn.in_transaction
+    assert _product_indexes(conn) == before
+    assert conn.execute("SELECT COUNT(*) FROM product WHERE name = 'Partial'").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM partner WHERE name = 'Caller'").fetchone()[0] == 1
+
+
+def test_upsert_batch_error_keeps_callers_statements(tmp_path, monkeypatch):
+    conn = make_db(tmp_path)
+    # a NOT NULL violation aborts the batch statement; items are retried one by one
+    monkeypatch.setattr(ingest_service, "_batch_rows", lambda *args: [(None, None, 1, None, 1)])
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("INSERT INTO partner (name, format) VALUES ('Caller', 'json')")
+    items = [{"sku": "", "name": "Hub", "price_cents": 30, "stock": 2}]
+    assert upsert_products(conn, items, commit=False) == (1, [])
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM partner WHERE name = 'Caller'").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM product").fetchone()[0] == 2
+
+
+def test_upsert_commit_false_leaves_transaction_to_caller(tmp_path):
+    conn = make_db(tmp_path)
+    conn.execute("INSERT INTO partner (name, format) VALUES ('P', 'json')")
+    conn.commit()
+    items = [{"sku": "", "name": "Hub", "price_cents": 30, "stock": 2}]
+    assert upsert_products(conn, items, partner_id=1, feed_hash="h2", commit=False) == (1, [])
+    assert conn.in_transaction
+    conn.rollback()
+    assert conn.execute("SELECT COUNT(*) FROM product WHERE name = 'Hub'").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM partner_feed_imports").fetchone()[0] == 0
@@ -1,17 +1,24 @@
 import json
+
+import pytest
+
 from src.partners.routes import app
 
 
-def test_help_endpoint():
-    c = app.test_client()
+@pytest.fixture(scope="module")
+def c():
+    # these endpoints are stateless, so one client serves the whole module
+    return app.test_client()
+
+
+def test_help_endpoint(c):
     rv = c.get('/partner/help')
     assert rv.status_code == 200
     info = rv.get_json()
     assert 'post_example' in info
 
 
-def test_help_and_error_format():
-    c = app.test_client()
+def test_help_and_error_format(c):
     rv = c.get('/partner/help')
     assert rv.status_code == 200
     help_json = rv.get_json()
@@ -22,3 +29,33 @@ def test_help_and_error_format():
     assert rv2.status_code in (401, 400)
     j = rv2.get_json()
     assert 'error' in j and 'details' in j
+
+
+def test_help_and_contract_support_conditional_get(c):
+    for path in ('/partner/help', '/partner/contract', '/partner/contract/example'):
+        rv = c.get(path)
+        assert rv.status_code == 200 and rv.get_json()
+        etag = rv.headers['ETag']
+        assert 'max-age=3600' in rv.headers['Cache-Control']
+        rv2 = c.get(path, headers={'If-None-Match': etag})
+        assert rv2.status_code == 304 and rv2.data == b''
+
+
+def test_contract_validate_stops_at_max_errors(c):
+    feed = json.dumps([{"name": ""}] * 500)
+    rv = c.post('/partner/contract/validate?max_errors=5', data=feed, content_type='application/json',
+                headers={'X-API-Key': 'max-errors-probe'})
+    assert rv.status_code == 422
+    body = rv.get_json()
+    assert body['rejected'] == 5 and body['truncated'] is True
+
+
+def test_contract_validate_caps_client_max_errors(c):
+    headers = {'X-API-Key': 'max-errors-cap-probe'}
+    feed = json.dumps([{"name": ""}] * 500)
+    body = c.post('/partner/contract/validate?max_errors=100000000', data=feed, content_type='application/json', headers=headers).get_json()
+    assert body['rejected'] == 100 and body['truncated'] is True
+    # exactly max_errors errors with nothing left unchecked is not truncated
+    feed = json.dumps([{"name": ""}] * 5)
+    body = c.post('/partner/contract/validate?max_errors=5', data=feed, content_type='application/json', headers=headers).get_json()
+    assert body['rejected'] == 5 and body['truncated'] is False
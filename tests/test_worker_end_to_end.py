@@ -1,16 +1,16 @@
 import os
 import json
-import time
 import sqlite3
 import importlib
-from pathlib import Path
+
+from src.partners.testing import create_test_db
 
 
 def setup_db(tmp_path):
     dbfile = tmp_path / "test_app.sqlite"
-    sql = Path("db/init.sql").read_text()
+    # schema copied from a per-session template (already in WAL mode)
+    create_test_db(str(dbfile))
     conn = sqlite3.connect(str(dbfile))
-    conn.executescript(sql)
     cur = conn.cursor()
     cur.execute("INSERT INTO partner (name, format, endpoint) VALUES (?, ?, ?)", ("WorkerPartner", "json", "/"))
     pid = cur.lastrowid
@@ -26,8 +26,10 @@ def test_worker_processes_enqueued_job(tmp_path):
 
     import src.partners.routes as routes
     import src.partners.ingest_queue as iq
-    importlib.reload(routes)
+    # reload the queue first so routes binds the same worker module the test waits on
     importlib.reload(iq)
+    importlib.reload(routes)
+    baseline = iq.attempts_done()
 
     app = routes.app
     client = app.test_client()
@@ -41,15 +43,7 @@ def test_worker_processes_enqueued_job(tmp_path):
     stop = iq.start_worker(db_path)
 
     # wait up to 3 seconds for job to be processed
-    for _ in range(30):
-        conn = sqlite3.connect(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT status FROM partner_ingest_jobs ORDER BY id DESC LIMIT 1")
-        row = cur.fetchone()
-        conn.close()
-        if row and row[0] == 'done':
-            break
-        time.sleep(0.1)
+    assert iq.wait_for_attempts(baseline + 1, timeout=3.0)
 
     # verify product inserted
     conn = sqlite3.connect(db_path)
@@ -68,8 +62,10 @@ def test_metrics_endpoint_updates(tmp_path):
 
     import src.partners.routes as routes
     import src.partners.ingest_queue as iq
-    importlib.reload(routes)
+    # reload the queue first so routes binds the same worker module the test waits on
     importlib.reload(iq)
+    importlib.reload(routes)
+    baseline = iq.attempts_done()
 
     app = routes.app
     client = app.test_client()
@@ -86,13 +82,7 @@ def test_metrics_endpoint_updates(tmp_path):
     # start worker
     iq.start_worker(db_path)
     # wait for processing
-    import time
-    for _ in range(30):
-        r = client.get('/partner/metrics')
-        data = r.get_json()
-        if data.get('processed', 0) > before.get('processed', 0):
-            break
-        time.sleep(0.1)
+    assert iq.wait_for_attempts(baseline + 1, timeout=3.0)
 
     r = client.get('/partner/metrics')
     data = r.get_json()
@@ -100,14 +90,17 @@ def test_metrics_endpoint_updates(tmp_path):
     assert data.get('processed', 0) >= 1
 
 
-def test_requeue_failed_job(tmp_path):
+def test_requeue_failed_job(tmp_path, monkeypatch):
     db_path, pid = setup_db(tmp_path)
     os.environ["APP_DB_PATH"] = db_path
 
     import src.partners.routes as routes
     import src.partners.ingest_queue as iq
-    importlib.reload(routes)
+    # reload the queue first so routes binds the same worker module the test waits on
     importlib.reload(iq)
+    importlib.reload(routes)
+    # drive the worker by hand instead of the background thread
+    monkeypatch.setattr(routes, "start_worker", lambda db_path: None)
 
     app = routes.app
     client = app.test_client()
@@ -116,40 +109,22 @@ def test_requeue_failed_job(tmp_path):
     bad_payload = [{"sku": "sku-bad", "name": "", "price": 1.0, "stock": 1}]
     resp = client.post("/partner/ingest?async=1", data=json.dumps(bad_payload), content_type="application/json", headers={"X-API-Key": "test-key"})
     assert resp.status_code == 202
+    job_id = resp.get_json()["job_id"]
 
-    # run worker to process and wait for failed job
-    iq.start_worker(db_path)
-    import time
-    job_id = None
-    for _ in range(50):
-        conn = sqlite3.connect(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT id FROM partner_ingest_jobs WHERE status = 'failed' LIMIT 1")
-        row = cur.fetchone()
-        conn.close()
-        if row:
-            job_id = row[0]
-            break
-        time.sleep(0.1)
-    assert job_id is not None
+    result = iq.process_next_job_once(db_path)
+    assert result["job_id"] == job_id and result["status"] == "failed"
+    assert iq.process_next_job_once(db_path) is None
 
     # requeue the failed job using API key
     r = client.post(f"/partner/jobs/{job_id}/requeue", headers={"X-API-Key": "test-key"})
     assert r.status_code == 200
 
-    # start worker and ensure it processes (it should fail again on validation but status will be failed)
-    # ensure worker has had time to reprocess the job
-    import time
-    st = None
-    for _ in range(60):
-        conn = sqlite3.connect(db_path)
-        cur = conn.cursor()
-        cur.execute("SELECT status FROM partner_ingest_jobs WHERE id = ?", (job_id,))
-        row = cur.fetchone()
-        conn.close()
-        if row:
-            st = row[0]
-            if st in ("failed", "done"):
-                break
-        time.sleep(0.1)
-    assert st in ("failed", "done")
+    # it fails validation again on the next run
+    result = iq.process_next_job_once(db_path)
+    assert result["job_id"] == job_id and result["status"] == "failed"
+
+    # audits are deferred to the pool's writer, like the threaded worker's
+    iq.get_pool(db_path).execute_write_fn(lambda conn: None)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM partner_ingest_audit WHERE action = 'worker_validation_failed'").fetchone()[0] == 2
+    conn.close()
@@ -3,17 +3,11 @@ import sqlite3
 import threading
 from pathlib import Path
 
-# Ensure we can import from src/
-import sys
+from src.dao import SalesRepo, ProductRepo, get_connection
+from src.payment import process as payment_process
 
 ROOT = Path(__file__).resolve().parents[1]
-SRC = ROOT / "src"
 DB_SQL = ROOT / "db" / "init.sql"
-if str(SRC) not in sys.path:
-	sys.path.insert(0, str(SRC))
-
-from dao import SalesRepo, ProductRepo, get_connection  # type: ignore  # noqa: E402
-from payment import process as payment_process  # type: ignore  # noqa: E402
 
 
 def create_core_tables(conn: sqlite3.Connection):
@@ -55,9 +49,9 @@ def seed_user_product(conn: sqlite3.Connection, *, user_name: str = "Alice", pro
 	return user_id, product_id
 
 
-def test_checkout_success(tmp_path):
-	db_path = tmp_path / "test_success.sqlite"
-	conn = get_connection(str(db_path))
+def test_checkout_success():
+	# single connection, so an in-memory DB is enough
+	conn = get_connection(":memory:")
 	create_core_tables(conn)
 	apply_b_schema(conn)
 	user_id, product_id = seed_user_product(conn, price_cents=1234, stock=5)
@@ -97,9 +91,9 @@ def test_checkout_success(tmp_path):
 	assert stock == 3
 
 
-def test_checkout_decline(tmp_path):
-	db_path = tmp_path / "test_decline.sqlite"
-	conn = get_connection(str(db_path))
+def test_checkout_decline():
+	# single connection, so an in-memory DB is enough
+	conn = get_connection(":memory:")
 	create_core_tables(conn)
 	apply_b_schema(conn)
 	user_id, product_id = seed_user_product(conn, price_cents=500, stock=3)